@@ -1,6 +1,11 @@
 from django.urls import path
 
-from .api_views import api_list_attendees, api_show_attendee
+from .api_views import (
+    api_bulk_create_attendees,
+    api_create_badges,
+    api_list_attendees,
+    api_show_attendee,
+)
 
 urlpatterns = [
     path(
@@ -8,5 +13,15 @@ urlpatterns = [
         api_list_attendees,
         name="api_list_attendees",
     ),
+    path(
+        "conferences/<int:conference_id>/attendees/bulk/",
+        api_bulk_create_attendees,
+        name="api_bulk_create_attendees",
+    ),
+    path(
+        "conferences/<int:conference_id>/badges/",
+        api_create_badges,
+        name="api_create_badges",
+    ),
     path("attendees/<int:pk>/", api_show_attendee, name="api_show_attendee"),
 ]
@@ -1,14 +1,23 @@
 import json
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.views.decorators.http import require_http_methods
 from common.encoders import AttendeeDetailEncoder, AttendeeListEncoder
-from events.models import Conference
+from common.cache import invalidate
+from common.responses import (
+    JsonResponse,
+    cache_response,
+    get_encoder,
+    list_response,
+)
+from events.models import Conference, ConferenceFull
 
-from .models import Attendee
+from .models import Attendee, Badge
 
 
 @require_http_methods(["GET", "POST"])
+@cache_response("conference:{conference_id}:attendees")
 def api_list_attendees(request, conference_id):
     """
     Lists the attendees names and the link to the attendee
@@ -34,10 +43,11 @@ def api_list_attendees(request, conference_id):
 
     if request.method == "GET":
         # return json with instance parameters serialized to json
-        return JsonResponse(
-            {"attendees": attendees},
-            encoder=AttendeeListEncoder,
-            safe=False,
+        return list_response(
+            request,
+            "attendees",
+            attendees,
+            AttendeeListEncoder,
         )
 
     elif request.method == "POST":
@@ -52,7 +62,14 @@ def api_list_attendees(request, conference_id):
                 status=400,
             )
 
-        attendees = Attendee.objects.create(**content)
+        # (saving it takes a place at the conference)
+        try:
+            attendees = Attendee.objects.create(**content)
+        except ConferenceFull:
+            return JsonResponse(
+                {"message": "Conference is full"},
+                status=409,
+            )
         return JsonResponse(
             {"attendees": attendees},
             encoder=AttendeeDetailEncoder,
@@ -70,7 +87,139 @@ def api_list_attendees(request, conference_id):
     # return JsonResponse({"attendees": attendees})
 
 
+def parse_bulk_rows(request):
+    """
+    Returns the rows of a bulk request: the items of a JSON array,
+    or (for application/x-ndjson) one JSON value per line. A line
+    that isn't valid JSON comes back as a ValueError.
+    """
+    if request.content_type == "application/x-ndjson":
+        rows = []
+        for line in request.body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                rows.append(e)
+        return rows
+
+    rows = json.loads(request.body)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array")
+    return rows
+
+
+@require_http_methods(["POST"])
+def api_bulk_create_attendees(request, conference_id):
+    """
+    Creates many attendees for the specified conference at once.
+
+    Takes a JSON array of attendees (or, with the
+    application/x-ndjson content type, one attendee per line),
+    each with the same properties as a single POST. The valid
+    ones are saved with bulk_create, in batches, in a single
+    transaction. If the conference doesn't have room for all of
+    them, none are saved and a 409 is returned.
+
+    Returns the number created and a result for each row, in
+    order: the new attendee's URL or the row's errors.
+
+    {
+        "created": number of attendees created,
+        "attendees": [
+            {"href": URL to the new attendee},
+            {"errors": {property: [message, ...], ...}},
+            ...
+        ]
+    }
+    """
+    try:
+        conference = Conference.objects.get(id=conference_id)
+    except Conference.DoesNotExist:
+        return JsonResponse(
+            {"message": "Invalid conference id"},
+            status=400,
+        )
+
+    try:
+        rows = parse_bulk_rows(request)
+    except ValueError as e:
+        return JsonResponse(
+            {"message": f"Invalid request body: {e}"},
+            status=400,
+        )
+
+    # validate every row first, keeping each row's attendee or errors
+    results = []
+    attendees = []
+    for row in rows:
+        if isinstance(row, ValueError):
+            results.append({"__all__": [f"Invalid JSON: {row}"]})
+            continue
+        if not isinstance(row, dict):
+            results.append({"__all__": ["Expected a JSON object"]})
+            continue
+        try:
+            attendee = Attendee(**row, conference=conference)
+            attendee.full_clean(exclude=["conference"])
+        except TypeError as e:
+            results.append({"__all__": [str(e)]})
+        except ValidationError as e:
+            results.append(e.message_dict)
+        else:
+            results.append(attendee)
+            attendees.append(attendee)
+
+    # all the valid rows get a place, or none of them do
+    try:
+        Attendee.objects.bulk_create(
+            attendees,
+            batch_size=settings.BULK_CREATE_BATCH_SIZE,
+        )
+    except ConferenceFull:
+        return JsonResponse(
+            {"message": "Conference is full"},
+            status=409,
+        )
+    # bulk_create doesn't send post_save
+    invalidate(*(s for a in attendees for s in a.cache_scopes()))
+
+    return JsonResponse(
+        {
+            "created": len(attendees),
+            "attendees": [
+                {"href": r.get_api_url()}
+                if isinstance(r, Attendee)
+                else {"errors": r}
+                for r in results
+            ],
+        }
+    )
+
+
+@require_http_methods(["POST"])
+def api_create_badges(request, conference_id):
+    """
+    Creates the badges of every attendee of the specified
+    conference that doesn't have one yet.
+
+    {
+        "created": the number of badges created,
+    }
+    """
+    if not Conference.objects.filter(id=conference_id).exists():
+        return JsonResponse(
+            {"message": "Invalid conference id"},
+            status=400,
+        )
+
+    created = Badge.create_for_conference(conference_id)
+    return JsonResponse({"created": created})
+
+
 @require_http_methods(["GET", "DELETE", "PUT"])
+@cache_response("attendee:{pk}")
 def api_show_attendee(request, pk):
     """
     Returns the details for the Attendee model specified
@@ -90,17 +239,30 @@ def api_show_attendee(request, pk):
             "href": the URL to the conference,
         }
     }
+
+    With ?fields=name,... only those properties (and the href) are
+    loaded and returned.
+
+    With ?expand=conference the conference's details are nested
+    instead (and ?expand=conference.location adds its location's).
     """
     if request.method == "GET":
         # get model instance given specific id
-        attendee = Attendee.objects.get(id=pk)
+        encoder = get_encoder(request, AttendeeDetailEncoder)
+        # (loading the conference id even with ?fields=, for the scope)
+        attendee = encoder.prepare_queryset(
+            Attendee.objects.all(), "conference"
+        ).get(id=pk)
 
         # return json with instance parameters serialized to json
-        return JsonResponse(
+        response = JsonResponse(
             attendee,
-            encoder=AttendeeDetailEncoder,
+            encoder=encoder,
             safe=False,
         )
+        # (it shows the conference, and with ?expand= its location)
+        response.cache_scopes = [f"conference:{attendee.conference_id}"]
+        return response
 
     elif request.method == "DELETE":
         count, _ = Attendee.objects.filter(id=pk).delete()
@@ -108,9 +270,29 @@ def api_show_attendee(request, pk):
 
     elif request.method == "PUT":
         content = json.loads(request.body)
-        Attendee.objects.filter(id=pk).update(**content)
 
+        if "conference" in content:
+            if not Conference.objects.filter(
+                id=content["conference"]
+            ).exists():
+                return JsonResponse(
+                    {"message": "Invalid conference id"},
+                    status=400,
+                )
+
+        # save() rather than update(), so that moving the attendee to
+        # another conference takes a place there (and gives the old
+        # one back)
         attendee = Attendee.objects.get(id=pk)
+        for name, value in content.items():
+            setattr(attendee, Attendee._meta.get_field(name).attname, value)
+        try:
+            attendee.save()
+        except ConferenceFull:
+            return JsonResponse(
+                {"message": "Conference is full"},
+                status=409,
+            )
         return JsonResponse(
             attendee,
             encoder=AttendeeDetailEncoder,
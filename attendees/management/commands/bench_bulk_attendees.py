@@ -0,0 +1,97 @@
+import json
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from attendees.api_views import api_bulk_create_attendees, api_list_attendees
+from events.models import Conference, Location, State
+
+
+class Command(BaseCommand):
+    help = (
+        "Times creating attendees with one bulk request against one POST "
+        "each. The rows are added in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1000,
+            help="Number of attendees to create each way",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options["rows"])
+            transaction.set_rollback(True)
+
+    def create_conference(self, rows):
+        state = State.objects.first() or State.objects.create(
+            id=1, name="Illinois", abbreviation="IL"
+        )
+        location = Location.objects.create(
+            name="Bench hall",
+            city="Chicago",
+            room_count=3,
+            state=state,
+        )
+        now = datetime.now(timezone.utc)
+        return Conference.objects.create(
+            name="Bench conference",
+            starts=now,
+            ends=now,
+            description="A conference",
+            max_presentations=0,
+            max_attendees=rows,
+            location=location,
+        )
+
+    def run(self, rows):
+        factory = RequestFactory()
+        attendees = [
+            {"email": f"attendee{i}@example.com", "name": f"Attendee {i}"}
+            for i in range(rows)
+        ]
+
+        # (the views are called directly, so only their work is timed)
+        conference = self.create_conference(rows)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for attendee in attendees:
+                response = api_list_attendees(
+                    factory.post(
+                        "/",
+                        json.dumps(attendee),
+                        content_type="application/json",
+                    ),
+                    conference_id=conference.id,
+                )
+                assert response.status_code == 200, response.content
+            single = time.perf_counter() - start
+        single_queries = len(queries)
+
+        conference = self.create_conference(rows)
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = api_bulk_create_attendees(
+                factory.post(
+                    "/",
+                    json.dumps(attendees),
+                    content_type="application/json",
+                ),
+                conference_id=conference.id,
+            )
+            bulk = time.perf_counter() - start
+        assert response.status_code == 200, response.content
+
+        self.stdout.write(
+            f"{rows} attendees: "
+            f"single POSTs {single * 1000:.1f}ms ({single_queries} queries), "
+            f"bulk {bulk * 1000:.1f}ms ({len(queries)} queries) "
+            f"({single / bulk:.1f}x)"
+        )
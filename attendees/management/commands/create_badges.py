@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from attendees.models import Badge
+from events.models import Conference
+
+
+class Command(BaseCommand):
+    help = "Creates the missing badges for a conference's attendees"
+
+    def add_arguments(self, parser):
+        parser.add_argument("conference_id", type=int)
+
+    def handle(self, *args, **options):
+        conference_id = options["conference_id"]
+        if not Conference.objects.filter(id=conference_id).exists():
+            raise CommandError(f"No conference with id {conference_id}")
+
+        created = Badge.create_for_conference(conference_id)
+        self.stdout.write(f"Created {created} badge(s)")
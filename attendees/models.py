@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.urls import reverse
 
+from common.cache import invalidate, invalidate_instance
+from events.models import ConferenceCountedModel, release_place
 
-class Attendee(models.Model):
+
+class Attendee(ConferenceCountedModel):
     """
     The Attendee model represents someone that wants to attend
     a conference
     """
 
+    counter = "attendee_count"
+
     email = models.EmailField()
     name = models.CharField(max_length=200)
     company_name = models.CharField(max_length=200, null=True, blank=True)
@@ -26,6 +33,15 @@ class Attendee(models.Model):
     def get_api_url(self):
         return reverse("api_show_attendee", kwargs={"pk": self.pk})
 
+    def cache_scopes(self):
+        return [
+            f"attendee:{self.pk}",
+            *(
+                f"conference:{id}:attendees"
+                for id in self.get_conference_ids()
+            ),
+        ]
+
     def create_badge(self):
         # if not self.badge:
         #     badge = Badge.objects.create(
@@ -56,3 +72,39 @@ class Badge(models.Model):
         on_delete=models.CASCADE,
         primary_key=True,
     )
+
+    @classmethod
+    def create_for_conference(cls, conference_id):
+        """
+        Creates the missing badges for all of a conference's attendees
+        with one query to find them and bulk inserts for the badges.
+
+        Safe to run again, or at the same time as another run: badges
+        that already exist are skipped by the database (the attendee
+        is the badge's primary key). Returns the number of attendees
+        that had no badge when the query ran.
+        """
+        attendee_ids = Attendee.objects.filter(
+            conference_id=conference_id,
+            badge__isnull=True,
+        ).values_list("id", flat=True)
+
+        badges = [cls(attendee_id=id) for id in attendee_ids]
+        cls.objects.bulk_create(
+            badges,
+            batch_size=settings.BULK_CREATE_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        # bulk_create doesn't send post_save
+        invalidate(*(scope for b in badges for scope in b.cache_scopes()))
+        return len(badges)
+
+    def cache_scopes(self):
+        return [f"attendee:{self.attendee_id}"]
+
+
+post_delete.connect(release_place, sender=Attendee)
+post_save.connect(invalidate_instance, sender=Attendee)
+post_delete.connect(invalidate_instance, sender=Attendee)
+post_save.connect(invalidate_instance, sender=Badge)
+post_delete.connect(invalidate_instance, sender=Badge)
@@ -0,0 +1,266 @@
+import json
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+
+from events.models import Conference, ConferenceFull
+from events.tests import ConferenceDataMixin, create_conference
+
+from .models import Attendee
+
+
+def post_attendee(client, conference, i):
+    return client.post(
+        f"/api/conferences/{conference.id}/attendees/",
+        json.dumps({"email": f"new{i}@example.com", "name": f"New {i}"}),
+        content_type="application/json",
+    )
+
+
+class AttendeeCountTests(ConferenceDataMixin, TestCase):
+    def assert_count(self, conference, count):
+        conference.refresh_from_db()
+        self.assertEqual(conference.attendee_count, count)
+        self.assertEqual(conference.attendees.count(), count)
+
+    def test_orm_creates_and_deletes_are_counted(self):
+        self.assert_count(self.conference, 1)
+        attendee = Attendee.objects.create(
+            email="orm@example.com",
+            name="ORM",
+            conference=self.conference,
+        )
+        self.assert_count(self.conference, 2)
+        attendee.delete()
+        self.assert_count(self.conference, 1)
+
+    def test_full_conference_rejects_attendees(self):
+        Conference.objects.filter(id=self.conference.id).update(
+            max_attendees=1
+        )
+        with self.assertRaises(ConferenceFull):
+            Attendee.objects.create(
+                email="orm@example.com",
+                name="ORM",
+                conference=self.conference,
+            )
+        self.assertEqual(
+            post_attendee(self.client, self.conference, 1).status_code,
+            409,
+        )
+        self.assert_count(self.conference, 1)
+
+    def test_moving_an_attendee_moves_the_place(self):
+        other = create_conference(self.location, "Other")
+        attendee = self.conference.attendees.get()
+        response = self.client.put(
+            f"/api/attendees/{attendee.id}/",
+            json.dumps({"conference": other.id}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_count(self.conference, 0)
+        self.assert_count(other, 1)
+
+    def test_conference_delete_doesnt_release_each_attendee(self):
+        self.add_rows(20)
+        with CaptureQueriesContext(connection) as queries:
+            self.conference.delete()
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(updates, [])
+
+
+class AttendeeProjectionTests(ConferenceDataMixin, TestCase):
+    def test_fields_only_load_those_columns(self):
+        attendee = self.conference.attendees.get()
+        url = f"/api/attendees/{attendee.id}/"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{url}?fields=name")
+        self.assertEqual(response.json(), {"href": url, "name": "Attendee 0"})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("email", queries[0]["sql"])
+
+
+class AttendeeCacheTests(ConferenceDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.attendee = self.conference.attendees.get()
+        self.url = f"/api/attendees/{self.attendee.id}/"
+        self.client.get(self.url)
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_other_conferences_dont_evict(self):
+        other = create_conference(self.location, "Other")
+        other.save()
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_own_conference_and_location_evict(self):
+        for instance in (self.conference, self.location):
+            instance.save()
+            with self.assertNumQueries(1):
+                self.client.get(self.url)
+
+    def test_move_evicts_old_conference_list(self):
+        other = create_conference(self.location, "Other")
+        list_url = f"/api/conferences/{self.conference.id}/attendees/"
+        self.assertEqual(len(self.client.get(list_url).json()["attendees"]), 1)
+
+        self.client.put(
+            self.url,
+            json.dumps({"conference": other.id}),
+            content_type="application/json",
+        )
+        self.assertEqual(self.client.get(list_url).json()["attendees"], [])
+
+    @override_settings(API_CACHE_REPLICA_TIMEOUT=7)
+    def test_replica_reads_stored_briefly(self):
+        self.attendee.save()
+        cache = caches[settings.API_CACHE]
+        with mock.patch(
+            "common.responses.reads_from_replica", return_value=True
+        ), mock.patch.object(cache, "set", wraps=cache.set) as store:
+            with self.assertNumQueries(1):
+                self.client.get(self.url)
+            with self.assertNumQueries(0):
+                self.client.get(self.url)
+        self.assertEqual(store.call_args.args[2], 7)
+
+        # a client reading its own writes from the primary doesn't get
+        # the replica's copy
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+
+class AttendeeBulkCreateTests(ConferenceDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/conferences/{self.conference.id}/attendees/bulk/"
+
+    def post(self, body, content_type="application/json"):
+        return self.client.post(self.url, body, content_type=content_type)
+
+    def assert_created(self, response, count):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], count)
+        self.conference.refresh_from_db()
+        self.assertEqual(self.conference.attendee_count, 1 + count)
+        self.assertEqual(self.conference.attendees.count(), 1 + count)
+
+    def test_rows_get_their_own_errors(self):
+        response = self.post(
+            json.dumps(
+                [
+                    {"email": "a@example.com", "name": "A"},
+                    {"email": "not an email", "name": "B"},
+                    {"email": "c@example.com"},
+                    "not an object",
+                    {"email": "e@example.com", "name": "E", "age": 3},
+                    {"email": "f@example.com", "name": "F"},
+                ]
+            )
+        )
+        self.assert_created(response, 2)
+        results = response.json()["attendees"]
+        self.assertEqual(
+            [sorted(r) for r in results],
+            [
+                ["href"],
+                ["errors"],
+                ["errors"],
+                ["errors"],
+                ["errors"],
+                ["href"],
+            ],
+        )
+        self.assertIn("email", results[1]["errors"])
+        self.assertIn("name", results[2]["errors"])
+        self.assertEqual(
+            results[3]["errors"], {"__all__": ["Expected a JSON object"]}
+        )
+        self.assertIn("__all__", results[4]["errors"])
+        self.assertEqual(
+            self.client.get(results[5]["href"]).json()["name"],
+            "F",
+        )
+
+    def test_ndjson(self):
+        lines = [
+            json.dumps({"email": "a@example.com", "name": "A"}),
+            "",
+            "{not json",
+            json.dumps({"email": "b@example.com", "name": "B"}),
+        ]
+        response = self.post("\n".join(lines), "application/x-ndjson")
+        self.assert_created(response, 2)
+        errors = response.json()["attendees"][1]["errors"]["__all__"]
+        self.assertTrue(errors[0].startswith("Invalid JSON"))
+
+    def test_all_or_nothing_when_full(self):
+        Conference.objects.filter(id=self.conference.id).update(
+            max_attendees=3
+        )
+        rows = [
+            {"email": f"new{i}@example.com", "name": f"New {i}"}
+            for i in range(3)
+        ]
+        response = self.post(json.dumps(rows))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {"message": "Conference is full"})
+        self.assert_created(self.post(json.dumps(rows[:2])), 2)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post(json.dumps({"name": "A"})).status_code, 400)
+        self.assertEqual(self.post("[").status_code, 400)
+        response = self.client.post(
+            "/api/conferences/0/attendees/bulk/",
+            "[]",
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalidates_the_list(self):
+        list_url = f"/api/conferences/{self.conference.id}/attendees/"
+        self.assertEqual(len(self.client.get(list_url).json()["attendees"]), 1)
+        self.post(json.dumps([{"email": "a@example.com", "name": "A"}]))
+        self.assertEqual(len(self.client.get(list_url).json()["attendees"]), 2)
+
+
+class AttendeeConcurrencyTests(ConferenceDataMixin, TransactionTestCase):
+    def test_parallel_posts_dont_overbook(self):
+        Conference.objects.filter(id=self.conference.id).update(
+            max_attendees=5
+        )
+
+        statuses = []
+
+        def post(i):
+            try:
+                response = post_attendee(Client(), self.conference, i)
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [200] * 4 + [409] * 16)
+        self.conference.refresh_from_db()
+        self.assertEqual(self.conference.attendee_count, 5)
+        self.assertEqual(self.conference.attendees.count(), 5)
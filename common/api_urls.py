@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .api_views import api_metrics
+
+urlpatterns = [
+    path("_metrics", api_metrics, name="api_metrics"),
+]
@@ -0,0 +1,50 @@
+from django.views.decorators.http import require_http_methods
+
+from . import http, metrics
+from .responses import JsonResponse
+
+
+@require_http_methods(["GET"])
+def api_metrics(request):
+    """
+    Returns the request metrics of each endpoint (by URL name), as
+    recorded by PerformanceMiddleware when the API_METRICS setting is
+    on, and the outbound HTTP metrics of each host (see
+    common.http.get_metrics). The endpoints' times are in
+    milliseconds.
+
+    {
+        "endpoints": {
+            URL name: {
+                "requests": number of requests,
+                "latency_avg": average wall time,
+                "latency_max": longest wall time,
+                "histogram": {
+                    bucket's upper bound: number of requests at most
+                        that long,
+                    ...
+                    "+Inf": number of requests,
+                },
+                "db_avg": average time in database queries,
+                "http_avg": average time in outbound HTTP requests,
+                "serialize_avg": average time encoding model instances,
+                "db_queries_avg": average number of queries,
+            },
+            ...
+        },
+        "http": {
+            host: {
+                "requests": number of requests,
+                "errors": number of failed requests,
+                ...
+            },
+            ...
+        },
+    }
+    """
+    return JsonResponse(
+        {
+            "endpoints": metrics.get_metrics(),
+            "http": http.get_metrics(),
+        }
+    )
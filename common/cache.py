@@ -0,0 +1,255 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+
+
+class _Call:
+    """
+    A fetch that is in flight for a TTLCache key, which the other
+    threads asking for the same key wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+# returned by TTLCache.get for keys that aren't cached
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A thread-safe, size-bounded cache whose entries expire ttl
+    seconds after they were stored.
+
+    When the cache is full the least recently used entry is
+    evicted. get_or_set (and aget_or_set, from coroutines)
+    collapses concurrent misses for the same key into a single
+    call to fetch.
+    """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        # must be called with the lock held
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                return value
+            del self._entries[key]
+        return MISSING
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def get_or_set(self, key, fetch):
+        with self._lock:
+            value = self._get(key)
+            if value is not MISSING:
+                return value
+
+            # somebody else is already fetching this key, so wait for
+            # their result instead of making the same request again
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fetch()
+        except Exception as error:
+            call.error = error
+            raise
+        else:
+            self.set(key, call.value)
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.value
+
+    async def aget_or_set(self, key, fetch):
+        """
+        Like get_or_set, but fetch is a coroutine function and
+        coroutines waiting on the same key share one task.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        # (a task can only be awaited on the loop it runs on, so each
+        # event loop shares its own)
+        task_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = asyncio.ensure_future(
+                    self._afetch(task_key, key, fetch)
+                )
+                self._tasks[task_key] = task
+
+        # shield the shared task so that one cancelled request doesn't
+        # cancel the fetch the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _afetch(self, task_key, key, fetch):
+        try:
+            value = await fetch()
+            self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._tasks[task_key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LookupCache:
+    """
+    A process-local copy of a small, fixed lookup table (like the
+    State and Status Value Objects), keyed by one of its fields.
+
+    The rows are loaded with one query on first use and dropped
+    when one of them is saved or deleted in this process. Changes
+    made by other processes are picked up after LOOKUP_CACHE_TTL
+    seconds, or for a key that isn't cached yet, on a reload at most
+    every LOOKUP_CACHE_MISS_INTERVAL seconds.
+    """
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        # (loaded_at, rows), replaced as a whole so that readers
+        # don't need the lock
+        self._loaded = None
+        self._lock = threading.Lock()
+
+        post_save.connect(self.clear, sender=model, weak=False)
+        post_delete.connect(self.clear, sender=model, weak=False)
+
+    def load(self):
+        with self._lock:
+            rows = {
+                getattr(o, self.field): o for o in self.model.objects.all()
+            }
+            self._loaded = loaded = (time.monotonic(), rows)
+            return loaded
+
+    def get_loaded(self):
+        # returns (loaded_at, rows), reloading them when they're too old
+        loaded = self._loaded
+        if (
+            loaded is None
+            or time.monotonic() - loaded[0] > settings.LOOKUP_CACHE_TTL
+        ):
+            loaded = self.load()
+        return loaded
+
+    def rows(self):
+        return self.get_loaded()[1]
+
+    def all(self):
+        return list(self.rows().values())
+
+    def get(self, value):
+        """
+        Returns the row whose field equals value, or raises the
+        model's DoesNotExist like objects.get would.
+        """
+        loaded_at, rows = self.get_loaded()
+        row = rows.get(value)
+        if (
+            row is None
+            and time.monotonic() - loaded_at
+            > settings.LOOKUP_CACHE_MISS_INTERVAL
+        ):
+            # it may have been added by another process (checked at
+            # most every LOOKUP_CACHE_MISS_INTERVAL seconds)
+            row = self.load()[1].get(value)
+        if row is None:
+            raise self.model.DoesNotExist(
+                f"{self.model.__name__} matching {self.field}={value!r} "
+                "does not exist."
+            )
+        return row
+
+    def clear(self, **kwargs):
+        self._loaded = None
+
+
+def get_api_cache():
+    return caches[settings.API_CACHE]
+
+
+def scope_key(scope):
+    return f"api-scope:{scope}"
+
+
+def get_scope_versions(scopes):
+    """
+    Returns the current version of each of the scopes (names like
+    "conference:5:attendees" for the things a cached response shows),
+    starting a version for any that don't have one yet.
+    """
+    cache = get_api_cache()
+    keys = [scope_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # add() so that we don't replace a version another process
+            # just set
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*scopes):
+    """
+    Gives the scopes new versions, so every cached response that
+    showed any of them is missed from now on (and left to expire).
+    """
+    get_api_cache().set_many(
+        {scope_key(scope): uuid.uuid4().hex for scope in set(scopes)},
+        None,
+    )
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    """
+    A post_save/post_delete receiver that invalidates the scopes
+    returned by the instance's cache_scopes().
+    """
+    invalidate(*instance.cache_scopes())
@@ -1,9 +1,17 @@
 from attendees.models import Attendee
 from common.json import ModelEncoder
-from events.models import Conference, Location
+from events.models import Conference, Location, State
 from presentations.models import Presentation
 
 
+class StateEncoder(ModelEncoder):
+    model = State
+    properties = [
+        "name",
+        "abbreviation",
+    ]
+
+
 class LocationListEncoder(ModelEncoder):
     model = Location
     properties = [
@@ -21,7 +29,12 @@ class LocationDetailEncoder(ModelEncoder):
         "updated",
         "state",
         "image_url",
+        "image_pending",
     ]
+    relations = ["state"]
+    expandable = {
+        "state": StateEncoder(),
+    }
 
     # override get_extra_data of class def
     def get_extra_data(self, o):
@@ -54,6 +67,9 @@ class ConferenceDetailEncoder(ModelEncoder):
     encoders = {
         "location": LocationListEncoder(),
     }
+    expandable = {
+        "location": LocationDetailEncoder(),
+    }
 
 
 class PresentationListEncoder(ModelEncoder):
@@ -62,6 +78,7 @@ class PresentationListEncoder(ModelEncoder):
         "title",
         "status",
     ]
+    relations = ["status"]
 
     # override get_extra_data of class def
     def get_extra_data(self, o):
@@ -84,6 +101,10 @@ class PresentationDetailEncoder(ModelEncoder):
     encoders = {
         "conference": ConferenceListEncoder(),
     }
+    expandable = {
+        "conference": ConferenceDetailEncoder(),
+    }
+    relations = ["status"]
 
     # override get_extra_data of class def
     def get_extra_data(self, o):
@@ -110,3 +131,6 @@ class AttendeeDetailEncoder(ModelEncoder):
     encoders = {
         "conference": ConferenceListEncoder(),
     }
+    expandable = {
+        "conference": ConferenceDetailEncoder(),
+    }
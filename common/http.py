@@ -0,0 +1,300 @@
+import asyncio
+import threading
+import time
+import weakref
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import add_timing
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of making a request to a host whose circuit
+    breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after `failures` failures in a row,
+    for `reset` seconds. After that one trial request is let
+    through: if it succeeds the circuit closes again, otherwise it
+    stays open for another `reset` seconds.
+    """
+
+    def __init__(self, failures, reset):
+        self.failures = failures
+        self.reset = reset
+        self._count = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial:
+                return False
+            if time.monotonic() - self._opened_at < self.reset:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._count = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._count += 1
+            if self._trial or self._count >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    def release(self):
+        # the request ended without a result for the host (e.g. it was
+        # cancelled, or its URL was invalid), so if it was the trial,
+        # let the next one be
+        with self._lock:
+            self._trial = False
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+
+_lock = threading.Lock()
+_breakers = {}
+_stats = defaultdict(HostStats)
+
+
+def get_breaker(host):
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(
+                failures=settings.HTTP_CIRCUIT_FAILURES,
+                reset=settings.HTTP_CIRCUIT_RESET,
+            )
+        return breaker
+
+
+def record(host, elapsed, failed):
+    add_timing("http", elapsed)
+    with _lock:
+        stats = _stats[host]
+        stats.requests += 1
+        stats.errors += failed
+        stats.latency_total += elapsed
+        stats.latency_max = max(stats.latency_max, elapsed)
+
+
+def reject(host):
+    with _lock:
+        _stats[host].rejected += 1
+    raise CircuitOpenError(f"Circuit open for {host}")
+
+
+def create_session():
+    retry = Retry(
+        total=settings.HTTP_RETRIES,
+        backoff_factor=settings.HTTP_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=("GET",),
+        # hand the last response back rather than raising, so it's
+        # counted as a failure like any other 5xx
+        raise_on_status=False,
+    )
+    # requests keeps one pool (of up to pool_maxsize keep-alive
+    # connections) per host
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_HOSTS,
+        pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+session = create_session()
+
+
+def get(url, **kwargs):
+    """
+    Makes a GET request with the shared, pooled session.
+
+    Requests time out after HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT
+    seconds and are retried (with backoff) on connection errors and
+    502/503/504 responses. Raises CircuitOpenError without making
+    the request when the host has been failing.
+    """
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        reject(host)
+
+    kwargs.setdefault(
+        "timeout",
+        (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT),
+    )
+    start = time.perf_counter()
+    try:
+        response = session.get(url, **kwargs)
+    except requests.RequestException:
+        breaker.record_failure()
+        record(host, time.perf_counter() - start, True)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+
+    failed = response.status_code >= 500
+    if failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    record(host, time.perf_counter() - start, failed)
+    return response
+
+
+# the async client of each running event loop, with the generator that
+# closes it (see close_on_shutdown)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+async def close_on_shutdown(client):
+    """
+    An async generator that closes client when it's finalized.
+
+    Event loops finalize the async generators started on them (with
+    loop.shutdown_asyncgens(), which asyncio.run, asgiref and uvicorn
+    call) before they close, so the client's connections are closed
+    while the loop they belong to can still do it.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def get_async_client():
+    """
+    Returns the httpx.AsyncClient shared by the coroutines running
+    on the current event loop, so their requests reuse pooled
+    keep-alive connections.
+
+    Connections belong to the loop they were opened on, so each loop
+    (e.g. the ones asgiref starts to run async code from sync code)
+    gets its own client, which is closed when the loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.HTTP_READ_TIMEOUT,
+                connect=settings.HTTP_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=settings.HTTP_POOL_MAXSIZE,
+            ),
+            # (httpx only retries failed connection attempts)
+            transport=httpx.AsyncHTTPTransport(retries=settings.HTTP_RETRIES),
+        )
+        # start the generator, which registers it with the loop
+        closer = close_on_shutdown(client)
+        asyncio.ensure_future(closer.__anext__())
+        entry = _async_clients[loop] = (client, closer)
+    return entry[0]
+
+
+async def aget(url, **kwargs):
+    """
+    Like get, but made with the shared async client.
+
+    Raises httpx.HTTPError (or CircuitOpenError) on failure.
+    """
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        reject(host)
+
+    start = time.perf_counter()
+    try:
+        response = await get_async_client().get(url, **kwargs)
+    except httpx.HTTPError:
+        breaker.record_failure()
+        record(host, time.perf_counter() - start, True)
+        raise
+    except BaseException:
+        # (including asyncio.CancelledError)
+        breaker.release()
+        raise
+
+    failed = response.status_code >= 500
+    if failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    record(host, time.perf_counter() - start, failed)
+    return response
+
+
+def get_metrics():
+    """
+    Returns the outbound request counts and latencies per host.
+
+    pool_hits is the number of requests made on an already open
+    (keep-alive) connection of the sync session's pools.
+    """
+    # urllib3 counts connections opened and requests made per pool
+    connections = defaultdict(lambda: [0, 0])
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            counts = connections[f"{pool.host}:{pool.port}"]
+            counts[0] += pool.num_connections
+            counts[1] += pool.num_requests
+
+    metrics = {}
+    with _lock:
+        for host, stats in _stats.items():
+            metrics[host] = {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "rejected": stats.rejected,
+                "latency_avg": (
+                    stats.latency_total / stats.requests
+                    if stats.requests
+                    else None
+                ),
+                "latency_max": stats.latency_max,
+            }
+    for pool_host, (opened, made) in connections.items():
+        host = pool_host
+        if host not in metrics:
+            # the host key above has no port for default ports
+            host = pool_host.rsplit(":", 1)[0]
+        if host in metrics:
+            metrics[host]["connections_opened"] = opened
+            metrics[host]["pool_hits"] = made - opened
+    return metrics
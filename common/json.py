@@ -1,7 +1,43 @@
+import json
+import time
 from datetime import datetime
 from json import JSONEncoder
 
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
 from django.db.models import QuerySet
+from django.urls import get_script_prefix
+
+from .metrics import current_timings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# a pk that can't be mistaken for any other part of a URL, used to turn
+# a model's get_api_url() into a template (see ModelEncoder.get_href)
+HREF_PK = 918273645
+
+
+def dumps(data, encoder=JSONEncoder):
+    """
+    Returns data as JSON bytes, calling the encoder's default() for
+    the objects JSON doesn't have a type for (model instances,
+    QuerySets, ...).
+
+    Uses orjson, which writes bytes straight from the dicts and
+    formats datetimes itself, when it's installed and the
+    API_JSON_BACKEND setting is "orjson"; otherwise the standard
+    library's json.
+    """
+    if orjson is not None and settings.API_JSON_BACKEND == "orjson":
+        return orjson.dumps(
+            data,
+            default=encoder().default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(data, cls=encoder).encode()
 
 
 class DateEncoder(JSONEncoder):
@@ -29,47 +65,305 @@ class ModelEncoder(DateEncoder, QuerySetEncoder, JSONEncoder):
     # create empty encoders dictionary that will hold property-encodername k-vs
     encoders = {}
 
+    # the encoders that ?expand= switches properties to (usually the
+    # related model's detail encoder), see with_expand
+    expandable = {}
+
+    # names of the foreign keys that get_extra_data follows, so that
+    # prepare_queryset can load them with select_related (the ones in
+    # encoders are added automatically)
+    relations = []
+
     def default(self, o):
         # if the object to decode is the same class as what's in the
         # model property, then
         if isinstance(o, self.model):
-            # create an empty dictionary that will hold the property names
-            # as keys and the property values as values
-            d = {}
-
-            # if o has the attribute get_api_url
-            if hasattr(o, "get_api_url"):
-                # then add its return value to the dictionary
-                # with the key "href"
-                d["href"] = o.get_api_url()
-
-            # for each name in the properties list
-            for property in self.properties:
-                # get the value of that property from the model instance
-                # given just the property name
-                value = getattr(o, property)
-
-                # check if property is in self.encoders attribute
-                if property in self.encoders:
-                    # store value of property (encoder name)
-                    encoder = self.encoders[property]
-                    # set value (to add to d) to #TODO - understand
-                    value = encoder.default(value)
-
-                # put it into the dictionary with that property name as
-                # the key
-                d[property] = value
-
-            # update dictionary per get_extra_data (where o is the key)
-            d.update(self.get_extra_data(o))
-
-            # return the dictionary
-            return d
+            # time the encoding itself under "serialize" (this is where
+            # the views' JSON time goes; the QuerySets are evaluated
+            # before it, and their queries are counted under "db")
+            timings = current_timings.get()
+            if timings is None:
+                return self.encode_model(o)
+            start = time.perf_counter()
+            try:
+                return self.encode_model(o)
+            finally:
+                timings.add("serialize", time.perf_counter() - start)
         # otherwise
         else:
             # return super().default(o)  # From the documentation
             return super().default(o)
 
+    def encode_model(self, o):
+        """
+        Returns the dictionary for the model instance o, following the
+        compiled plan (see get_plan).
+        """
+        # look up the compiled plan once per call instead of
+        # re-inspecting the encoder and the instance for every property
+        href, steps, extra = self.get_plan()
+
+        # create a dictionary that will hold the property names as keys
+        # and the property values as values, starting with the href put
+        # together from the template (reverse() is too slow to run for
+        # every row)
+        if href is None:
+            d = {}
+        elif href is True:
+            d = {"href": o.get_api_url()}
+        else:
+            d = {"href": f"{get_script_prefix()}{href[0]}{o.pk}{href[1]}"}
+
+        # for each compiled step, get the value of that property and run
+        # it through its nested encoder (if it has one)
+        for property, encode in steps:
+            value = getattr(o, property)
+            if encode is not None:
+                value = encode(value)
+            d[property] = value
+
+        # update dictionary per get_extra_data (where o is the key)
+        if extra is not None:
+            d.update(extra(self, o))
+
+        # return the dictionary
+        return d
+
+    @classmethod
+    def get_plan(cls):
+        """
+        Returns the serialization plan for this encoder class,
+        compiling it on first use.
+
+        The plan is a tuple of (href, steps, extra) where href is
+        what get_href returns, steps is a tuple of (property, nested
+        encoder's encode_model or None) pairs and extra is the
+        get_extra_data function, or None when the encoder doesn't
+        override it.
+        """
+        # look in the class' own __dict__ so that subclasses don't
+        # reuse the plan compiled for their parent
+        plan = cls.__dict__.get("_plan")
+        if plan is None:
+            plan = cls.compile_plan()
+            cls._plan = plan
+        return plan
+
+    @classmethod
+    def compile_plan(cls):
+        href = cls.get_href()
+
+        steps = []
+        for property in cls.properties:
+            encoder = cls.encoders.get(property)
+            # (the nested encoder's encode_model, since the time it
+            # takes is already counted in this encoder's default)
+            steps.append(
+                (
+                    property,
+                    encoder.encode_model if encoder is not None else None,
+                )
+            )
+
+        extra = cls.get_extra_data
+        if extra is ModelEncoder.get_extra_data:
+            extra = None
+
+        return href, tuple(steps), extra
+
+    @classmethod
+    def get_href(cls):
+        """
+        Returns the model's get_api_url() as a (before pk, after pk)
+        pair of strings relative to the script prefix, e.g.
+        ("api/attendees/", "/"), so that default() only has to format
+        the pk into it. Returns True when get_api_url doesn't build
+        its URL from the pk alone (default() then calls it for every
+        object), and None when the model doesn't have one.
+        """
+        if not hasattr(cls.model, "get_api_url"):
+            return None
+
+        url = cls.model(pk=HREF_PK).get_api_url()
+        prefix = get_script_prefix()
+        pk = str(HREF_PK)
+        if not url.startswith(prefix) or url.count(pk) != 1:
+            return True
+        before, after = url.removeprefix(prefix).split(pk)
+        return before, after
+
+    @classmethod
+    def get_select_related(cls):
+        """
+        Returns the select_related paths for every relation this
+        encoder (and its nested encoders) reads.
+        """
+        paths = list(cls.relations)
+        for property, encoder in cls.encoders.items():
+            if property not in cls.properties:
+                continue
+            paths.append(property)
+            for path in encoder.get_select_related():
+                paths.append(f"{property}__{path}")
+        return paths
+
+    @classmethod
+    def get_only(cls):
+        """
+        Returns the only() field names for the columns this encoder
+        (and its nested encoders) reads, or None when a property
+        isn't a model field and so all columns have to be loaded.
+        """
+        fields = []
+        for property in cls.properties:
+            try:
+                cls.model._meta.get_field(property)
+            except FieldDoesNotExist:
+                return None
+            fields.append(property)
+
+            encoder = cls.encoders.get(property)
+            if encoder is not None:
+                nested = encoder.get_only()
+                if nested is None:
+                    return None
+                fields.extend(f"{property}__{field}" for field in nested)
+
+        # keep the foreign key columns of the declared relations so they
+        # can be traversed (their related rows are loaded in full)
+        fields.extend(r for r in cls.relations if r not in fields)
+        return fields
+
+    @classmethod
+    def get_defer(cls):
+        """
+        Returns the names of the model's own columns this encoder
+        doesn't read, for views that load rows with their own
+        select_related and so can't use prepare_queryset's only().
+        """
+        return [
+            field.name
+            for field in cls.model._meta.concrete_fields
+            if not field.primary_key
+            and not field.is_relation
+            and field.name not in cls.properties
+        ]
+
+    @classmethod
+    def with_fields(cls, fields):
+        """
+        Returns a subclass of this encoder that only outputs the
+        given properties (and the href), so that prepare_queryset
+        only loads their columns too. Names that aren't properties
+        are ignored.
+
+        get_extra_data is expected to add only the values of the
+        relations, so it's skipped when none of them are kept.
+        """
+        properties = tuple(p for p in cls.properties if p in fields)
+        if len(properties) == len(cls.properties):
+            return cls
+
+        # one subclass (and compiled plan) per set of properties, kept
+        # on the class it was made from
+        projections = cls.__dict__.get("_projections")
+        if projections is None:
+            projections = {}
+            cls._projections = projections
+
+        encoder = projections.get(properties)
+        if encoder is None:
+            relations = [r for r in cls.relations if r in properties]
+            attrs = {"properties": list(properties), "relations": relations}
+            if not relations:
+                attrs["get_extra_data"] = ModelEncoder.get_extra_data
+            encoder = type(cls.__name__, (cls,), attrs)
+            projections[properties] = encoder
+        return encoder
+
+    @classmethod
+    def with_expand(cls, paths):
+        """
+        Returns a subclass of this encoder that outputs the relations
+        named in paths with their expandable encoders instead of the
+        usual ones, so prepare_queryset also selects what those read.
+        A dotted path ("location.state") expands inside an expanded
+        relation. Paths that can't be expanded are ignored.
+
+        The expanded values replace what get_extra_data returns for
+        the same names.
+        """
+        nested = {}
+        for path in paths:
+            property, _, rest = path.partition(".")
+            if property in cls.expandable and property in cls.properties:
+                nested.setdefault(property, [])
+                if rest:
+                    nested[property].append(rest)
+        if not nested:
+            return cls
+
+        expanded = {
+            property: type(cls.expandable[property]).with_expand(rest)
+            for property, rest in nested.items()
+        }
+
+        # one subclass per set of expanded encoders, kept on the class
+        # it was made from
+        expansions = cls.__dict__.get("_expansions")
+        if expansions is None:
+            expansions = {}
+            cls._expansions = expansions
+
+        key = tuple(sorted(expanded.items(), key=lambda item: item[0]))
+        encoder = expansions.get(key)
+        if encoder is None:
+            encoders = dict(cls.encoders)
+            for property, nested_encoder in expanded.items():
+                encoders[property] = nested_encoder()
+            attrs = {"encoders": encoders}
+
+            get_extra_data = cls.get_extra_data
+            if get_extra_data is not ModelEncoder.get_extra_data:
+
+                def get_extra_data_unexpanded(self, o):
+                    return {
+                        name: value
+                        for name, value in get_extra_data(self, o).items()
+                        if name not in expanded
+                    }
+
+                attrs["get_extra_data"] = get_extra_data_unexpanded
+
+            encoder = type(cls.__name__, (cls,), attrs)
+            expansions[key] = encoder
+        return encoder
+
+    @classmethod
+    def prepare_queryset(cls, queryset, *extra_fields):
+        """
+        Applies the select_related and only() that this encoder
+        needs, so encoding the whole QuerySet takes a single query.
+        extra_fields are loaded too (e.g. the foreign key a prefetch
+        matches rows on).
+        """
+        # (select_related() with no arguments would follow every
+        # foreign key, so only call it when there is something to follow)
+        paths = cls.get_select_related()
+        if paths:
+            queryset = queryset.select_related(*paths)
+        fields = cls.get_only()
+        if fields is not None:
+            fields.extend(f for f in extra_fields if f not in fields)
+            # keep the ordering columns loaded too, since pagination
+            # reads them from the last row of a page
+            for name in queryset.query.order_by or cls.model._meta.ordering:
+                name = name.lstrip("-")
+                if name not in fields and name != "pk":
+                    fields.append(name)
+            queryset = queryset.only(*fields)
+        return queryset
+
     # wherever you want to add extra data, you only need to add that
     # method to the specific model encoder that you're building
     def get_extra_data(self, o):
@@ -0,0 +1,198 @@
+import timeit
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from attendees.models import Attendee
+from common.encoders import (
+    AttendeeDetailEncoder,
+    ConferenceDetailEncoder,
+    PresentationDetailEncoder,
+)
+from common.json import ModelEncoder, dumps, orjson
+from events.models import Conference, Location, State
+from presentations.models import Presentation, Status
+
+
+class ReflectingEncoder(ModelEncoder):
+    """
+    The encoder as it was before the compiled plans: it inspects the
+    encoder and the instance again for every object (and calls
+    get_api_url, which runs reverse(), for every row).
+    """
+
+    def default(self, o):
+        if isinstance(o, self.model):
+            d = {}
+            if hasattr(o, "get_api_url"):
+                d["href"] = o.get_api_url()
+            for property in self.properties:
+                value = getattr(o, property)
+                if property in self.encoders:
+                    encoder = self.encoders[property]
+                    value = encoder.default(value)
+                d[property] = value
+            d.update(self.get_extra_data(o))
+            return d
+        else:
+            return super().default(o)
+
+
+def reflecting(encoder):
+    # the same encoder (with its nested encoders) without the plans
+    return type(
+        encoder.__name__,
+        (ReflectingEncoder, encoder),
+        {
+            "encoders": {
+                property: reflecting(type(nested))()
+                for property, nested in encoder.encoders.items()
+            },
+        },
+    )
+
+
+def make_rows(count):
+    # unsaved instances, so that only the encoding is measured
+    now = datetime.now(timezone.utc)
+    state = State(id=1, name="Illinois", abbreviation="IL")
+    status = Status(id=1, name="SUBMITTED")
+    rows = {Attendee: [], Conference: [], Presentation: []}
+    for i in range(1, count + 1):
+        location = Location(
+            id=i,
+            name=f"Hall {i}",
+            city="Chicago",
+            room_count=3,
+            state=state,
+            created=now,
+            updated=now,
+        )
+        conference = Conference(
+            id=i,
+            name=f"Conference {i}",
+            starts=now,
+            ends=now,
+            description="A conference",
+            created=now,
+            updated=now,
+            max_presentations=10,
+            max_attendees=100,
+            location=location,
+        )
+        rows[Conference].append(conference)
+        rows[Attendee].append(
+            Attendee(
+                id=i,
+                email=f"attendee{i}@example.com",
+                name=f"Attendee {i}",
+                company_name="Example",
+                created=now,
+                conference=conference,
+            )
+        )
+        rows[Presentation].append(
+            Presentation(
+                id=i,
+                presenter_name=f"Presenter {i}",
+                company_name=None,
+                presenter_email=f"presenter{i}@example.com",
+                title=f"Talk {i}",
+                synopsis="A talk",
+                created=now,
+                status=status,
+                conference=conference,
+            )
+        )
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the model encoders against encoders that inspect every "
+        "object again (as they did before the compiled plans), then "
+        "writing the same objects as JSON with each API_JSON_BACKEND"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1000,
+            help="Number of objects of each model to encode",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of runs to take the best time of",
+        )
+        parser.add_argument(
+            "--backend",
+            action="append",
+            choices=["json", "orjson"],
+            help=(
+                "JSON backend to time writing the objects with (can be "
+                "given more than once; both by default)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        backends = options["backend"] or ["json", "orjson"]
+        if "orjson" in backends and orjson is None:
+            raise CommandError("orjson isn't installed")
+
+        rows = make_rows(options["rows"])
+        for encoder in (
+            ConferenceDetailEncoder,
+            AttendeeDetailEncoder,
+            PresentationDetailEncoder,
+        ):
+            objects = rows[encoder.model]
+            times = {}
+            for name, cls in (
+                ("reflecting", reflecting(encoder)),
+                ("compiled", encoder),
+            ):
+                default = cls().default
+                times[name] = min(
+                    timeit.repeat(
+                        lambda: [default(o) for o in objects],
+                        number=1,
+                        repeat=options["repeat"],
+                    )
+                )
+
+            self.stdout.write(
+                f"{encoder.__name__}: {len(objects)} objects, "
+                f"reflecting {times['reflecting'] * 1000:.1f}ms, "
+                f"compiled {times['compiled'] * 1000:.1f}ms "
+                f"({times['reflecting'] / times['compiled']:.1f}x)"
+            )
+
+        for encoder in (
+            ConferenceDetailEncoder,
+            AttendeeDetailEncoder,
+            PresentationDetailEncoder,
+        ):
+            objects = rows[encoder.model]
+            times = {}
+            for backend in backends:
+                with override_settings(API_JSON_BACKEND=backend):
+                    times[backend] = min(
+                        timeit.repeat(
+                            lambda: dumps(objects, encoder),
+                            number=1,
+                            repeat=options["repeat"],
+                        )
+                    )
+
+            line = f"{encoder.__name__}: {len(objects)} objects written, "
+            line += ", ".join(
+                f"{backend} {seconds * 1000:.1f}ms"
+                for backend, seconds in times.items()
+            )
+            if len(times) == 2:
+                line += f" ({times['json'] / times['orjson']:.1f}x)"
+            self.stdout.write(line)
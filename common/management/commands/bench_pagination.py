@@ -0,0 +1,107 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from common.encoders import LocationListEncoder
+from common.pagination import encode_cursor, get_ordering, paginate
+from events.models import Location, State
+
+
+class Command(BaseCommand):
+    help = (
+        "Times reading pages at increasing depths of the locations list "
+        "with the keyset cursors against OFFSET. The rows are added in a "
+        "transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=50000,
+            help="Number of locations to add for the run",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Page size",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of runs to take the best time of",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options["rows"], options["limit"], options["repeat"])
+            transaction.set_rollback(True)
+
+    def run(self, rows, limit, repeat):
+        state = State.objects.first() or State.objects.create(
+            id=1, name="Illinois", abbreviation="IL"
+        )
+        Location.objects.bulk_create(
+            (
+                Location(
+                    name=f"Bench hall {i:08d}",
+                    city="Chicago",
+                    room_count=3,
+                    state=state,
+                )
+                for i in range(rows)
+            ),
+            batch_size=1000,
+        )
+
+        queryset = LocationListEncoder.prepare_queryset(Location.objects.all())
+        ordering = get_ordering(queryset)
+        ordered = queryset.order_by(
+            *(
+                f"-{name}" if descending else name
+                for name, descending in ordering
+            )
+        )
+        total = ordered.count()
+
+        depth = limit
+        while depth < total:
+            # the cursor a client following "next" would have at this
+            # depth: the ordering values of the row before it
+            last = ordered[depth - 1]
+            cursor = encode_cursor(
+                [getattr(last, name) for name, _ in ordering]
+            )
+            request = RequestFactory().get(
+                "/", {"limit": limit, "cursor": cursor}
+            )
+
+            end = depth + limit
+            times = {
+                "offset": min(
+                    timeit.repeat(
+                        lambda: list(ordered[depth:end]),
+                        number=1,
+                        repeat=repeat,
+                    )
+                ),
+                "keyset": min(
+                    timeit.repeat(
+                        lambda: paginate(request, queryset),
+                        number=1,
+                        repeat=repeat,
+                    )
+                ),
+            }
+
+            self.stdout.write(
+                f"page at row {depth}: "
+                f"offset {times['offset'] * 1000:.2f}ms, "
+                f"keyset {times['keyset'] * 1000:.2f}ms "
+                f"({times['offset'] / times['keyset']:.1f}x)"
+            )
+            depth *= 10
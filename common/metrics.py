@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# the upper bounds (ms) of the request latency histogram's buckets
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# the kinds of work timed within requests
+TIMINGS = ("db", "serialize", "http")
+
+
+class Timings:
+    """
+    The time (seconds) and number of calls spent on each kind of work
+    ("db", "serialize", "http") during one request.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, name, elapsed):
+        # (work can be done for the request in other threads)
+        with self.lock:
+            self.seconds[name] += elapsed
+            self.counts[name] += 1
+
+
+# the Timings of the current request, set by PerformanceMiddleware (None
+# when it's off, so that the timing below costs next to nothing)
+current_timings = ContextVar("current_timings", default=None)
+
+
+def add_timing(name, elapsed):
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, elapsed)
+
+
+@contextmanager
+def timed(name):
+    """
+    Adds the time spent in the with block to the current request's
+    timings under name.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+
+_lock = threading.Lock()
+_endpoints = defaultdict(EndpointStats)
+
+
+def record(name, elapsed, timings):
+    """
+    Adds a request to the stats of the endpoint (URL name) it went to.
+    """
+    ms = elapsed * 1000
+    bucket = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if ms <= bound:
+            bucket = i
+            break
+
+    with _lock:
+        stats = _endpoints[name]
+        stats.requests += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.histogram[bucket] += 1
+        for kind, seconds in timings.seconds.items():
+            stats.seconds[kind] += seconds
+            stats.counts[kind] += timings.counts[kind]
+
+
+def get_metrics():
+    """
+    Returns the request count, latencies (ms) and cumulative latency
+    histogram of each endpoint, with the average time spent per
+    request on the database, serialization and outbound HTTP.
+    """
+    metrics = {}
+    with _lock:
+        for name, stats in sorted(_endpoints.items()):
+            histogram = {}
+            count = 0
+            for bound, n in zip(LATENCY_BUCKETS, stats.histogram):
+                count += n
+                histogram[str(bound)] = count
+            histogram["+Inf"] = stats.requests
+
+            metrics[name] = {
+                "requests": stats.requests,
+                "latency_avg": stats.total * 1000 / stats.requests,
+                "latency_max": stats.max * 1000,
+                "histogram": histogram,
+                **{
+                    f"{kind}_avg": stats.seconds[kind] * 1000 / stats.requests
+                    for kind in TIMINGS
+                },
+                "db_queries_avg": stats.counts["db"] / stats.requests,
+            }
+    return metrics
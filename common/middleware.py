@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import Timings, current_timings, record, timed
+from .routers import read_from_replica
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaMiddleware:
+    """
+    Lets the reads of safe (GET, HEAD, OPTIONS) requests go to the read
+    replica.
+
+    A request that may have written sets a short-lived cookie, and
+    while the client sends it back its reads stay on the default
+    database, so it sees its own writes before they reach the replica.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # under ASGI, run as async middleware (marked the way Django's
+        # MiddlewareMixin does it) so that async views stay on the
+        # server's event loop
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        self.process_request(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_request(self, request):
+        # set on every request rather than reset afterwards, so
+        # streamed responses that query as they're sent still use it
+        read_from_replica.set(
+            request.method in SAFE_METHODS
+            and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+        )
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class PerformanceMiddleware:
+    """
+    Times each request and the database queries, model encoding
+    and outbound HTTP requests made for it. Adds them to the metrics
+    of the request's URL name (see /api/_metrics) and returns them in
+    a Server-Timing header.
+
+    Only installed when the API_METRICS setting is on.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.API_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # under ASGI, run as async middleware (see ReplicaMiddleware)
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+        # execute wrappers belong to one thread's connection, and under
+        # ASGI the queries are made in sync_to_async's threads, so every
+        # connection gets the timer, which times queries for whichever
+        # request's timings are current where they run
+        connection_created.connect(
+            install_query_timer, dispatch_uid="install_query_timer"
+        )
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        timings, token, start = self.start_timing()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish_timing(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings, token, start = self.start_timing()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish_timing(request, response, timings, start)
+
+    def start_timing(self):
+        timings = Timings()
+        token = current_timings.set(timings)
+        return timings, token, time.perf_counter()
+
+    def finish_timing(self, request, response, timings, start):
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        if match is not None and match.url_name:
+            record(match.url_name, elapsed, timings)
+
+        response["Server-Timing"] = ", ".join(
+            [
+                'db;dur=%.3f;desc="%d queries"'
+                % (timings.seconds["db"] * 1000, timings.counts["db"]),
+                "serialize;dur=%.3f" % (timings.seconds["serialize"] * 1000),
+                "http;dur=%.3f" % (timings.seconds["http"] * 1000),
+                "total;dur=%.3f" % (elapsed * 1000),
+            ]
+        )
+        return response
+
+
+def query_timer(execute, sql, params, many, context):
+    """
+    A database execute wrapper that adds each query's time to the
+    current request's timings (if there is one).
+    """
+    with timed("db"):
+        return execute(sql, params, many, context)
+
+
+def install_query_timer(connection, **kwargs):
+    # (first, since execute_wrapper() blocks remove the last wrapper
+    # when they end)
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_timer)
@@ -0,0 +1,128 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidPage(ValueError):
+    """
+    Raised for a cursor or page size that can't be used.
+    """
+
+
+def wants_page(request):
+    return "limit" in request.GET or "cursor" in request.GET
+
+
+def get_ordering(queryset):
+    """
+    Returns the (field name, descending) pairs a QuerySet is ordered
+    by: its order_by() or its model's Meta.ordering, then the primary
+    key so that every row has a unique position.
+    """
+    model = queryset.model
+    names = queryset.query.order_by or model._meta.ordering
+
+    ordering = []
+    for name in names:
+        if not isinstance(name, str) or "__" in name or name == "?":
+            raise ValueError(f"Can't paginate by {name!r}")
+        descending = name.startswith("-")
+        name = name.lstrip("-")
+        if name == "pk":
+            name = model._meta.pk.name
+        ordering.append((name, descending))
+
+    if not any(name == model._meta.pk.name for name, _ in ordering):
+        ordering.append((model._meta.pk.name, False))
+    return ordering
+
+
+def encode_cursor(values):
+    values = [
+        v.isoformat() if isinstance(v, (date, datetime)) else v for v in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise InvalidPage("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidPage("Invalid cursor")
+
+    try:
+        return [
+            model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(ordering, values)
+        ]
+    except Exception:
+        raise InvalidPage("Invalid cursor")
+
+
+def after(ordering, values):
+    """
+    Returns the filter for the rows after the row with the given
+    ordering values: a >= x AND ((a > x) OR (a = x AND b > y) OR ...)
+    """
+    q = Q()
+    equal = {}
+    for (name, descending), value in zip(ordering, values):
+        lookup = "lt" if descending else "gt"
+        q |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+
+    # also bound the first column on its own (a >= x), which lets the
+    # database start reading the index at the cursor; SQLite otherwise
+    # tests the OR on every row before it
+    name, descending = ordering[0]
+    lookup = "lte" if descending else "gte"
+    return Q(**{f"{name}__{lookup}": values[0]}) & q
+
+
+def get_page_size(request):
+    try:
+        size = int(request.GET.get("limit", settings.API_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPage("Invalid limit")
+    if size < 1:
+        raise InvalidPage("Invalid limit")
+    return min(size, settings.API_MAX_PAGE_SIZE)
+
+
+def paginate(request, queryset):
+    """
+    Returns one page of a QuerySet and the URL of the next page (or
+    None for the last one), for the ?limit= and ?cursor= parameters.
+
+    Pages are found by keyset (the ordering values of the last row
+    of the previous page, carried in the opaque cursor) instead of
+    OFFSET, so a deep page costs the same as the first one.
+    """
+    size = get_page_size(request)
+    ordering = get_ordering(queryset)
+
+    queryset = queryset.order_by(
+        *(f"-{name}" if descending else name for name, descending in ordering)
+    )
+    cursor = request.GET.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, queryset.model, ordering)
+        queryset = queryset.filter(after(ordering, values))
+
+    # read one row more than we need, to know if there's a next page
+    rows = list(queryset[: size + 1])
+    if len(rows) <= size:
+        return rows, None
+
+    rows = rows[:size]
+    last = rows[-1]
+    params = request.GET.copy()
+    params["cursor"] = encode_cursor(
+        [getattr(last, name) for name, _ in ordering]
+    )
+    return rows, f"{request.path}?{params.urlencode()}"
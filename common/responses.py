@@ -0,0 +1,361 @@
+import asyncio
+import hashlib
+import inspect
+import json
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_api_cache, get_scope_versions
+from .json import dumps
+from .pagination import InvalidPage, paginate, wants_page
+from .routers import reads_from_replica
+
+# values of ?stream= that turn on the streaming mode for a list
+STREAM_TRUE_VALUES = {"1", "true", "yes"}
+
+
+class JsonResponse(HttpResponse):
+    """
+    Django's JsonResponse, with the body written by common.json.dumps
+    (so by orjson, when it's installed).
+
+    Takes the same arguments; json_dumps_params, which orjson doesn't
+    have, make it use the standard library's json.
+    """
+
+    def __init__(
+        self,
+        data,
+        encoder=DjangoJSONEncoder,
+        safe=True,
+        json_dumps_params=None,
+        **kwargs,
+    ):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set "
+                "the safe parameter to False."
+            )
+        kwargs.setdefault("content_type", "application/json")
+        if json_dumps_params is None:
+            content = dumps(data, encoder)
+        else:
+            content = json.dumps(data, cls=encoder, **json_dumps_params)
+        super().__init__(content=content, **kwargs)
+
+
+def wants_stream(request):
+    # Django (before 4.2) sends a streamed response's chunks from the
+    # ASGI server's event loop, where the rows can't be queried
+    if isinstance(request, ASGIRequest):
+        return False
+    value = request.GET.get("stream")
+    if value is None:
+        return settings.API_STREAM_LISTS
+    return value.lower() in STREAM_TRUE_VALUES
+
+
+def iter_json_list(key, queryset, encoder, chunk_size):
+    """
+    Yields the JSON bytes for {key: [object, ...]} a chunk at a
+    time.
+
+    Rows are read with QuerySet.iterator so that only chunk_size
+    model instances (and their JSON) are held in memory at once.
+    The output is the JSON common.json.dumps would have produced
+    for the whole list.
+    """
+    yield b"{%s:[" % dumps(key)
+
+    separator = b""
+    chunk = []
+    for o in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(o)
+        if len(chunk) >= chunk_size:
+            # encode the chunk as a list and drop its brackets
+            yield separator + dumps(chunk, encoder)[1:-1]
+            separator = b","
+            chunk = []
+    if chunk:
+        yield separator + dumps(chunk, encoder)[1:-1]
+
+    yield b"]}"
+
+
+def get_query_list(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",")]
+
+
+def get_encoder(request, encoder):
+    """
+    Returns the encoder to use for the request: the given one, with
+    ?expand=relation,... switched to the detail encoders for those
+    relations and with ?fields=name,... only outputting (and loading)
+    those properties.
+    """
+    expand = get_query_list(request, "expand")
+    if expand is not None:
+        encoder = encoder.with_expand(expand)
+    fields = get_query_list(request, "fields")
+    if fields is not None:
+        encoder = encoder.with_fields(fields)
+    return encoder
+
+
+def list_response(request, key, queryset, encoder):
+    """
+    Returns the {key: [...]} response for a list view.
+
+    The QuerySet is first run through the encoder's prepare_queryset
+    so the rows' relations come back in the same query. ?expand=
+    and ?fields= change what's loaded and output (see get_encoder).
+
+    Requests with ?limit= or ?cursor= get one page of the list and
+    the URL of the next page in "next" (see common.pagination).
+
+    Otherwise, requests with ?stream=true (or every request, when the
+    API_STREAM_LISTS setting is on) get a StreamingHttpResponse
+    that encodes the rows as they are read from the database
+    instead of building the whole body in memory first. Under ASGI
+    the whole body is always built first.
+    """
+    encoder = get_encoder(request, encoder)
+    queryset = encoder.prepare_queryset(queryset)
+
+    if wants_page(request):
+        try:
+            rows, next_url = paginate(request, queryset)
+        except InvalidPage as e:
+            return JsonResponse({"message": str(e)}, status=400)
+
+        return JsonResponse(
+            {key: rows, "next": next_url},
+            encoder=encoder,
+            safe=False,
+        )
+
+    if wants_stream(request):
+        return StreamingHttpResponse(
+            iter_json_list(
+                key,
+                queryset,
+                encoder,
+                settings.API_STREAM_CHUNK_SIZE,
+            ),
+            content_type="application/json",
+        )
+
+    return JsonResponse(
+        {key: queryset},
+        encoder=encoder,
+        safe=False,
+    )
+
+
+def conditional_get(versions, last_modified=False):
+    """
+    Adds an ETag header to a view's GET responses and answers
+    matching If-None-Match requests with a 304, without calling the
+    view.
+
+    versions(*args, **kwargs) gets the view's URL arguments and
+    returns a list of values that change whenever the response
+    would (usually "updated" timestamps and row counts, read with a
+    cheap query), or None when there's nothing to compare (e.g. a
+    missing row). The ETag is a hash of those values and the query
+    string.
+
+    With last_modified, the latest datetime among the values is also
+    sent as Last-Modified (and If-Modified-Since is honored). Only
+    use it when every change to the response moves one of those
+    timestamps forward: deleted rows and the weather don't.
+
+    Works on sync and async views.
+    """
+
+    def check(request, args, kwargs):
+        # returns the 304 response (or None) and the validators
+        values = versions(*args, **kwargs)
+        if values is None:
+            return None, None, None
+
+        etag = hashlib.md5(
+            repr((values, request.GET.urlencode())).encode()
+        ).hexdigest()
+        etag = quote_etag(etag)
+        modified = None
+        if last_modified:
+            timestamps = [v for v in values if isinstance(v, datetime)]
+            if timestamps:
+                modified = int(max(timestamps).timestamp())
+
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=modified,
+        )
+        return response, etag, modified
+
+    def add_validators(response, etag, modified):
+        if response.status_code == 200 and etag is not None:
+            response.headers.setdefault("ETag", etag)
+            if modified is not None:
+                response.headers.setdefault(
+                    "Last-Modified",
+                    http_date(modified),
+                )
+        return response
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def ainner(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view(request, *args, **kwargs)
+
+                response, etag, modified = await sync_to_async(check)(
+                    request, args, kwargs
+                )
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    response = add_validators(response, etag, modified)
+                return response
+
+            return ainner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            response, etag, modified = check(request, args, kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                response = add_validators(response, etag, modified)
+            return response
+
+        return inner
+
+    return decorator
+
+
+def cache_response(*scopes, timeout=None):
+    """
+    Caches a view's successful GET responses, the JSON bytes and
+    content type, in the settings.API_CACHE cache.
+
+    scopes are the names of what the response shows, formatted with
+    the view's arguments (however they're passed), e.g.
+    "conference:{conference_id}:attendees".
+    They're part of the cache key along with their current versions,
+    so common.cache.invalidate() with any of them (done when the rows
+    change) makes the view run again.
+
+    A view can also set response.cache_scopes to the names of what
+    it found out it shows while making the response (e.g. the
+    attendee's conference). Their versions are stored with the
+    response, which is only used while they're unchanged.
+
+    Streamed responses aren't cached. Responses read from the replica
+    may be behind the writes that the scopes' versions already count,
+    so they're only kept for settings.API_CACHE_REPLICA_TIMEOUT (about
+    as long as the replica can lag) and under their own keys, so a
+    client reading its own writes from the primary never gets one.
+
+    Works on sync and async views.
+    """
+
+    def decorator(view):
+        signature = inspect.signature(view)
+
+        def lookup(request, args, kwargs):
+            # returns the cache key and the cached response (or None)
+            arguments = signature.bind(request, *args, **kwargs).arguments
+            names = [scope.format(**arguments) for scope in scopes]
+            versions = get_scope_versions(names)
+            key = (
+                "api-response:"
+                + hashlib.md5(
+                    repr(
+                        (
+                            request.build_absolute_uri(),
+                            versions,
+                            reads_from_replica(),
+                        )
+                    ).encode()
+                ).hexdigest()
+            )
+
+            cached = get_api_cache().get(key)
+            if cached is None:
+                return key, None
+            content, content_type, extra, extra_versions = cached
+            if extra and get_scope_versions(extra) != extra_versions:
+                return key, None
+            return key, HttpResponse(content, content_type=content_type)
+
+        def store(key, response):
+            if response.status_code != 200 or response.streaming:
+                return
+
+            seconds = (
+                settings.API_CACHE_TIMEOUT if timeout is None else timeout
+            )
+            if reads_from_replica():
+                seconds = min(seconds, settings.API_CACHE_REPLICA_TIMEOUT)
+
+            extra = getattr(response, "cache_scopes", [])
+            get_api_cache().set(
+                key,
+                (
+                    response.content,
+                    response["Content-Type"],
+                    extra,
+                    get_scope_versions(extra),
+                ),
+                seconds,
+            )
+
+        if asyncio.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def ainner(request, *args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return await view(request, *args, **kwargs)
+
+                key, response = await sync_to_async(lookup)(
+                    request, args, kwargs
+                )
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    await sync_to_async(store)(key, response)
+                return response
+
+            return ainner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+
+            key, response = lookup(request, args, kwargs)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                store(key, response)
+            return response
+
+        return inner
+
+    return decorator
@@ -0,0 +1,40 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# whether reads in the current request may go to the replica, set by
+# ReplicaMiddleware
+read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+def reads_from_replica():
+    """
+    Returns whether the current request's reads go to the replica
+    (which may not have the latest writes yet).
+    """
+    return bool(settings.REPLICA_DATABASE) and read_from_replica.get()
+
+
+class ReplicaRouter:
+    """
+    Sends reads of settings.REPLICA_APPS models to the
+    settings.REPLICA_DATABASE alias while read_from_replica is set, and
+    everything else, including all writes, to the default database.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = settings.REPLICA_DATABASE
+        if (
+            alias
+            and read_from_replica.get()
+            and model._meta.app_label in settings.REPLICA_APPS
+        ):
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same rows as the default database
+        return True
@@ -0,0 +1,482 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import set_script_prefix
+
+from common import http
+from common.cache import MISSING, TTLCache
+from common.encoders import AttendeeDetailEncoder, ConferenceListEncoder
+from common.json import dumps
+from common.management.commands.bench_encoders import make_rows, reflecting
+from common.metrics import Timings, current_timings
+from common.middleware import PerformanceMiddleware, install_query_timer
+from common.pagination import InvalidPage, encode_cursor, paginate
+from common.routers import read_from_replica
+from events.models import Conference, Location, State
+from events.tests import ConferenceDataMixin
+from presentations.models import Status, status_cache
+
+
+class ModelEncoderTests(SimpleTestCase):
+    def tearDown(self):
+        set_script_prefix("/")
+
+    def test_compiled_plan_matches_reflecting_encoder(self):
+        encoder = AttendeeDetailEncoder()
+        reference = reflecting(AttendeeDetailEncoder)()
+        for attendee in make_rows(3)[encoder.model]:
+            self.assertEqual(
+                encoder.default(attendee),
+                reference.default(attendee),
+            )
+
+    def test_href_follows_script_prefix(self):
+        conference = Conference(id=42)
+        set_script_prefix("/conference-go/")
+        self.assertEqual(
+            ConferenceListEncoder().default(conference)["href"],
+            conference.get_api_url(),
+        )
+        self.assertEqual(
+            conference.get_api_url(),
+            "/conference-go/api/conferences/42/",
+        )
+
+    def test_serialize_times_each_instance_once(self):
+        attendees = make_rows(3)[AttendeeDetailEncoder.model]
+        timings = Timings()
+        token = current_timings.set(timings)
+        try:
+            dumps(attendees, AttendeeDetailEncoder)
+        finally:
+            current_timings.reset(token)
+        # (not again for the nested conferences)
+        self.assertEqual(timings.counts["serialize"], 3)
+        self.assertGreater(timings.seconds["serialize"], 0)
+
+
+class TTLCacheTests(SimpleTestCase):
+    def test_expires_after_ttl(self):
+        cache = TTLCache(ttl=0.05, maxsize=10)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        time.sleep(0.1)
+        self.assertIs(cache.get("a"), MISSING)
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(ttl=60, maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_concurrent_misses_fetch_once(self):
+        cache = TTLCache(ttl=60, maxsize=10)
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait()
+            return "value"
+
+        with ThreadPoolExecutor(5) as executor:
+            futures = [
+                executor.submit(cache.get_or_set, "key", fetch)
+                for i in range(5)
+            ]
+            # let the others start waiting on the first one's fetch
+            time.sleep(0.1)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get("key"), "value")
+
+    def test_failed_fetch_is_shared_and_not_cached(self):
+        cache = TTLCache(ttl=60, maxsize=10)
+        release = threading.Event()
+
+        def fetch():
+            release.wait()
+            raise ValueError("upstream failed")
+
+        with ThreadPoolExecutor(3) as executor:
+            futures = [
+                executor.submit(cache.get_or_set, "key", fetch)
+                for i in range(3)
+            ]
+            time.sleep(0.1)
+            release.set()
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result()
+
+        self.assertIs(cache.get("key"), MISSING)
+        self.assertEqual(cache.get_or_set("key", lambda: "value"), "value")
+
+    def test_concurrent_awaits_share_one_fetch(self):
+        cache = TTLCache(ttl=60, maxsize=10)
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        async def main():
+            waiters = [
+                asyncio.ensure_future(cache.aget_or_set("key", fetch))
+                for i in range(5)
+            ]
+            await asyncio.sleep(0)
+            # one cancelled request doesn't cancel the others' fetch
+            waiters[0].cancel()
+            return await asyncio.gather(*waiters[1:])
+
+        self.assertEqual(asyncio.run(main()), ["value"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get("key"), "value")
+
+    def test_event_loops_dont_share_tasks(self):
+        cache = TTLCache(ttl=60, maxsize=10)
+        started = threading.Event()
+
+        async def fetch():
+            started.set()
+            await asyncio.sleep(0.1)
+            return "value"
+
+        def run():
+            return asyncio.run(cache.aget_or_set("key", fetch))
+
+        # the second loop can't await the first one's task, so it
+        # fetches for itself
+        with ThreadPoolExecutor(2) as executor:
+            first = executor.submit(run)
+            started.wait()
+            second = executor.submit(run)
+            self.assertEqual([first.result(), second.result()], ["value"] * 2)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = http.CircuitBreaker(failures=2, reset=0.05)
+
+    def open(self):
+        for i in range(2):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_lets_one_trial_through_after_reset(self):
+        self.open()
+        time.sleep(0.1)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_opens_again(self):
+        self.open()
+        time.sleep(0.1)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    @mock.patch.dict(http._breakers)
+    def test_trial_without_a_result_is_released(self):
+        url = "http://breaker.invalid/"
+        http._breakers["breaker.invalid"] = self.breaker
+        self.open()
+        time.sleep(0.1)
+
+        with mock.patch.object(http.session, "get", side_effect=KeyError):
+            with self.assertRaises(KeyError):
+                http.get(url)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+
+        async def cancelled():
+            with mock.patch.object(
+                http.get_async_client(),
+                "get",
+                side_effect=asyncio.CancelledError,
+            ):
+                await http.aget(url)
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancelled())
+        self.assertTrue(self.breaker.allow())
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    A stub upstream API that answers the first `failures` requests
+    with a 503.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.hits += 1
+        failed = self.server.hits <= self.server.failures
+        body = b"{}"
+        self.send_response(503 if failed else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledClientTests(SimpleTestCase):
+    def setUp(self):
+        self.upstream = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        self.upstream.hits = 0
+        self.upstream.failures = 0
+        thread = threading.Thread(target=self.upstream.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.upstream.shutdown)
+        self.host = "127.0.0.1:%d" % self.upstream.server_port
+        self.url = f"http://{self.host}/"
+
+    def test_retries_unavailable_responses(self):
+        self.upstream.failures = 2
+        self.assertEqual(http.get(self.url).status_code, 200)
+        self.assertEqual(self.upstream.hits, 3)
+        # (one request, as the view sees it)
+        self.assertEqual(http.get_metrics()[self.host]["requests"], 1)
+
+    def test_reuses_pooled_connections(self):
+        for i in range(3):
+            self.assertEqual(http.get(self.url).status_code, 200)
+        metrics = http.get_metrics()[self.host]
+        self.assertEqual(metrics["requests"], 3)
+        self.assertEqual(metrics["connections_opened"], 1)
+        self.assertEqual(metrics["pool_hits"], 2)
+
+    def test_async_client_counts_failures(self):
+        self.upstream.failures = 1
+
+        async def requests():
+            return [(await http.aget(self.url)).status_code for i in range(2)]
+
+        self.assertEqual(asyncio.run(requests()), [503, 200])
+        metrics = http.get_metrics()[self.host]
+        self.assertEqual(metrics["requests"], 2)
+        self.assertEqual(metrics["errors"], 1)
+
+
+class LookupCacheTests(TestCase):
+    def setUp(self):
+        Status.objects.create(id=1, name="SUBMITTED")
+        status_cache.clear()
+
+    def test_loads_once(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(status_cache.get("SUBMITTED").id, 1)
+            self.assertEqual(status_cache.get("SUBMITTED").id, 1)
+
+    def test_unknown_keys_reload_at_most_every_interval(self):
+        status_cache.get("SUBMITTED")
+        with self.assertNumQueries(0):
+            for i in range(3):
+                with self.assertRaises(Status.DoesNotExist):
+                    status_cache.get("APPROVED")
+
+        with override_settings(LOOKUP_CACHE_MISS_INTERVAL=-1):
+            # added by another process (without the signal)
+            Status.objects.bulk_create([Status(id=2, name="APPROVED")])
+            with self.assertNumQueries(1):
+                self.assertEqual(status_cache.get("APPROVED").id, 2)
+
+
+@override_settings(API_MAX_PAGE_SIZE=3)
+class PaginationTests(TestCase):
+    def setUp(self):
+        state = State.objects.create(id=1, name="Illinois", abbreviation="IL")
+        # (repeated names, so pages split rows with the same name)
+        for i in range(7):
+            Location.objects.create(
+                name=f"Hall {i % 3}",
+                city="Chicago",
+                room_count=i,
+                state=state,
+            )
+
+    def walk(self, queryset, path):
+        rows = []
+        while path is not None:
+            page, path = paginate(RequestFactory().get(path), queryset)
+            self.assertLessEqual(len(page), 2)
+            rows.extend(page)
+        return rows
+
+    def test_pages_cover_the_list_once(self):
+        queryset = Location.objects.all()
+        self.assertEqual(
+            self.walk(queryset, "/?limit=2"),
+            list(queryset.order_by("name", "id")),
+        )
+
+    def test_descending_ordering(self):
+        queryset = Location.objects.order_by("-name", "-room_count")
+        self.assertEqual(
+            self.walk(queryset, "/?limit=2"),
+            list(queryset.order_by("-name", "-room_count", "id")),
+        )
+
+    def test_cursor_through_the_api(self):
+        names = []
+        url = "/api/locations/?limit=2&fields=name"
+        while url is not None:
+            content = self.client.get(url).json()
+            names.extend(location["name"] for location in content["locations"])
+            url = content["next"]
+        self.assertEqual(
+            names,
+            list(Location.objects.values_list("name", flat=True)),
+        )
+
+    def test_invalid_pages(self):
+        for params, message in (
+            ({"cursor": "not a cursor"}, "Invalid cursor"),
+            ({"cursor": encode_cursor(["Hall 0"])}, "Invalid cursor"),
+            ({"cursor": encode_cursor(["Hall 0", "x"])}, "Invalid cursor"),
+            ({"limit": "0"}, "Invalid limit"),
+            ({"limit": "two"}, "Invalid limit"),
+        ):
+            with self.subTest(params=params):
+                with self.assertRaisesMessage(InvalidPage, message):
+                    paginate(
+                        RequestFactory().get("/", params),
+                        Location.objects.all(),
+                    )
+                response = self.client.get("/api/locations/", params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"message": message})
+
+    def test_limit_is_capped(self):
+        page, next_url = paginate(
+            RequestFactory().get("/?limit=100"),
+            Location.objects.all(),
+        )
+        self.assertEqual(len(page), 3)
+        self.assertIn("limit=100", next_url)
+
+
+@override_settings(REPLICA_DATABASE="replica")
+@mock.patch(
+    "events.api_views.get_location_weather",
+    return_value=(41.0, -87.0, None),
+)
+class ReplicaRoutingTests(ConferenceDataMixin, TransactionTestCase):
+    """
+    Uses the second SQLite file as the replica, which only gets the
+    default database's rows when sync() copies them over (so it's
+    behind the writes made since, like a lagging replica).
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        replica = connections["replica"]
+        mirrored = replica.settings_dict["TEST"].get("MIRROR")
+        if replica.vendor != "sqlite" or mirrored:
+            self.skipTest("needs the replica to be its own SQLite file")
+        super().setUp()
+        self.sync()
+        self.url = f"/api/conferences/{self.conference.id}/"
+
+    def tearDown(self):
+        # (the middleware leaves it set for the test's own queries)
+        read_from_replica.set(False)
+        super().tearDown()
+
+    def sync(self):
+        for alias in ("default", "replica"):
+            connections[alias].ensure_connection()
+        connections["default"].connection.backup(
+            connections["replica"].connection
+        )
+
+    def get_name(self, client):
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["conference"]["name"]
+
+    def test_reads_go_to_the_replica(self, get_location_weather):
+        Conference.objects.filter(id=self.conference.id).update(name="New")
+        self.assertEqual(self.get_name(self.client), "Conference")
+
+        self.sync()
+        caches[settings.API_CACHE].clear()
+        self.assertEqual(self.get_name(self.client), "New")
+
+    def test_reads_after_a_write_go_to_the_primary(self, get_location_weather):
+        response = self.client.put(
+            self.url,
+            '{"name": "New"}',
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+        # the client sends the cookie back, so it sees its own write
+        self.assertEqual(self.get_name(self.client), "New")
+        # while the others read the replica, which doesn't have it yet
+        caches[settings.API_CACHE].clear()
+        self.assertEqual(self.get_name(Client()), "Conference")
+
+
+@override_settings(API_METRICS=True, ROOT_URLCONF="events.tests")
+class PerformanceMiddlewareTests(ConferenceDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # (the test database's connection was opened before the
+        # middleware was loaded)
+        install_query_timer(connection)
+
+    def assert_timed_queries(self, response, count):
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'desc="{count} queries"', response["Server-Timing"])
+
+    def test_sync_view(self):
+        response = self.client.get("/api/locations/")
+        self.assert_timed_queries(response, 2)
+
+    async def test_async_view(self):
+        async def get_response(request):
+            pass
+
+        # (so Django doesn't adapt it, and async views stay on the loop)
+        middleware = PerformanceMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        # (queried in sync_to_async's thread, for the same timings)
+        response = await self.async_client.get("/async/locations/")
+        self.assert_timed_queries(response, 2)
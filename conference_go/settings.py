@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,7 @@ AUTH_USER_MODEL = "accounts.User"
 # Application definition
 
 INSTALLED_APPS = [
+    "common.apps.CommonConfig",
     "accounts.apps.AccountsConfig",
     "attendees.apps.AttendeesConfig",
     "events.apps.EventsConfig",
@@ -51,7 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "common.middleware.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "common.middleware.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     # "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,11 +88,96 @@ WSGI_APPLICATION = "conference_go.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": "data/db.sqlite3",
+# DATABASE_ENGINE=postgres uses PostgreSQL with the DATABASE_* variables
+# below, anything else uses the SQLite file (tuned by SQLITE_PRAGMAS)
+
+DATABASE_ENGINE = os.environ.get("DATABASE_ENGINE", "sqlite")
+
+if DATABASE_ENGINE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DATABASE_NAME", "conference_go"),
+            "USER": os.environ.get("DATABASE_USER", ""),
+            "PASSWORD": os.environ.get("DATABASE_PASSWORD", ""),
+            "HOST": os.environ.get("DATABASE_HOST", ""),
+            "PORT": os.environ.get("DATABASE_PORT", ""),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DATABASE_NAME", "data/db.sqlite3"),
+            # tests get a file too (rather than an in-memory database,
+            # whose threads lock each other out instead of waiting for
+            # busy_timeout), since some make requests from many threads
+            "TEST": {"NAME": "data/test_db.sqlite3"},
+        }
+    }
+
+# Keep connections open between requests for this many seconds (0 closes
+# them after every request), checking they still work before reusing them
+DATABASES["default"]["CONN_MAX_AGE"] = int(
+    os.environ.get("DATABASE_CONN_MAX_AGE", 60)
+)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# A read replica of the default database, used when DATABASE_REPLICA_NAME
+# or DATABASE_REPLICA_HOST is set: the other connection settings are the
+# same as the default database's
+if os.environ.get("DATABASE_REPLICA_NAME") or os.environ.get(
+    "DATABASE_REPLICA_HOST"
+):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get(
+            "DATABASE_REPLICA_NAME", DATABASES["default"]["NAME"]
+        ),
+        "HOST": os.environ.get(
+            "DATABASE_REPLICA_HOST", DATABASES["default"].get("HOST", "")
+        ),
+        # tests use the default database for both
+        "TEST": {"MIRROR": "default"},
     }
+    REPLICA_DATABASE = "replica"
+else:
+    # otherwise nothing reads from "replica", which is only there for
+    # the routing tests (see common.tests.ReplicaRoutingTests): with
+    # SQLite they copy the test database into a second file, which
+    # stands in for a replica
+    if DATABASE_ENGINE == "sqlite":
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "NAME": "data/replica.sqlite3",
+            "TEST": {"NAME": "data/test_replica.sqlite3"},
+        }
+    else:
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "TEST": {"MIRROR": "default"},
+        }
+    REPLICA_DATABASE = None
+
+DATABASE_ROUTERS = ["common.routers.ReplicaRouter"]
+
+# The alias safe requests read these apps from, if there is a replica
+REPLICA_APPS = ("events", "attendees", "presentations")
+
+# After a write, the client's reads stay on the default database for this
+# many seconds, long enough for the replica to catch up
+REPLICA_STICKY_COOKIE = "read_primary"
+REPLICA_STICKY_SECONDS = 10
+
+# PRAGMAs run on every new SQLite connection: WAL lets readers carry on
+# while a worker writes, NORMAL syncing is safe with WAL, busy_timeout
+# waits (ms) for the write lock instead of failing and mmap_size (bytes)
+# reads the file through memory mapping
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
 }
 
 
@@ -132,3 +221,111 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# API responses
+
+# Stream every list response instead of only those requested with
+# ?stream=true (only under WSGI: under ASGI, Django sends the chunks
+# from the event loop, where they can't be read from the database)
+API_STREAM_LISTS = False
+
+# Number of rows read from the database (and encoded) per chunk when
+# streaming a list response
+API_STREAM_CHUNK_SIZE = 2000
+
+
+# External APIs (events.acl)
+
+# Base URLs, so the lookups can be pointed at a local stub server
+OPEN_WEATHER_API_URL = "https://api.openweathermap.org"
+PEXELS_API_URL = "https://api.pexels.com"
+
+# Seconds a geocoded (city, state) and a weather report are cached for
+GEOCODE_CACHE_TTL = 7 * 24 * 60 * 60
+WEATHER_CACHE_TTL = 10 * 60
+
+# Maximum number of entries kept in each lookup cache
+ACL_CACHE_MAXSIZE = 1024
+
+# Number of background threads that fetch location images
+IMAGE_FETCH_WORKERS = 4
+
+# Number of threads that look up the weather while a request runs its
+# queries (see the conference bundle)
+WEATHER_FETCH_WORKERS = 4
+
+# Serve the views that wait on external APIs as async views (turn on
+# when running conference_go.asgi under an ASGI server)
+ASYNC_VIEWS = False
+
+# Outbound HTTP requests (common.http)
+
+# Seconds to wait for a connection, and then for the response
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT = 5
+
+# Retries for connection errors and 502/503/504 responses, with
+# exponential backoff starting at HTTP_RETRY_BACKOFF seconds
+HTTP_RETRIES = 2
+HTTP_RETRY_BACKOFF = 0.3
+
+# Number of hosts to keep connection pools for, and the number of
+# keep-alive connections in each pool
+HTTP_POOL_HOSTS = 10
+HTTP_POOL_MAXSIZE = 20
+
+# Failures in a row that open a host's circuit breaker, and the
+# seconds it stays open before a trial request is let through
+HTTP_CIRCUIT_FAILURES = 5
+HTTP_CIRCUIT_RESET = 30
+
+# Default and maximum number of rows in a page of a list (for requests
+# with ?limit= or ?cursor=)
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Number of rows inserted per query by the bulk endpoints
+BULK_CREATE_BATCH_SIZE = 500
+
+# Seconds before the cached State and Status tables are reloaded to pick
+# up changes made by other processes
+LOOKUP_CACHE_TTL = 5 * 60
+
+# Minimum seconds between the reloads of those tables caused by looking
+# up a value that isn't in them (so requests with bad values can't make
+# every lookup query the database)
+LOOKUP_CACHE_MISS_INTERVAL = 5
+
+# Seconds clients may cache a conference's stats for
+STATS_MAX_AGE = 30
+
+# The cache backend, local memory by default: set CACHE_BACKEND and
+# CACHE_LOCATION to share it between processes (e.g. with
+# django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# The cache that API responses are kept in, and for how many seconds
+API_CACHE = "default"
+API_CACHE_TIMEOUT = 5 * 60
+
+# How many seconds API responses read from the replica are cached for:
+# they can be as far behind as the replica lags, so no longer than a
+# client is kept on the primary after writing
+API_CACHE_REPLICA_TIMEOUT = REPLICA_STICKY_SECONDS
+
+# The JSON library API responses are written with: "orjson" uses orjson
+# when it's installed, "json" always uses the standard library
+API_JSON_BACKEND = "orjson"
+
+# Record per-endpoint timings (wall, database, serialization and
+# outbound HTTP) in Server-Timing headers and /api/_metrics
+API_METRICS = False
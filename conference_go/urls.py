@@ -21,4 +21,5 @@ urlpatterns = [
     path("api/", include("attendees.api_urls")),
     path("api/", include("events.api_urls")),
     path("api/", include("presentations.api_urls")),
+    path("api/", include("common.api_urls")),
 ]
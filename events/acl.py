@@ -1,7 +1,27 @@
+import httpx
 import requests
+from django.conf import settings
+
+from common import http
+from common.cache import TTLCache
 
 from .keys import OPEN_WEATHER_API_KEY, PEXEL_API_KEY
 
+# geocodes don't change, so keep them for a long time; weather is only
+# good for a few minutes
+coord_cache = TTLCache(
+    ttl=settings.GEOCODE_CACHE_TTL,
+    maxsize=settings.ACL_CACHE_MAXSIZE,
+)
+weather_cache = TTLCache(
+    ttl=settings.WEATHER_CACHE_TTL,
+    maxsize=settings.ACL_CACHE_MAXSIZE,
+)
+
+# what the fetches raise when an API can't be reached or fails (these
+# aren't cached, so the next lookup tries again)
+UPSTREAM_ERRORS = (requests.RequestException, httpx.HTTPError, ValueError)
+
 
 def get_image(city, state):
 
@@ -13,7 +33,9 @@ def get_image(city, state):
     one of the URLs for one of the pictures in the response"""
 
     # define url
-    url = f"https://api.pexels.com/v1/search?query={city}+{state}&per_page=1"
+    url = (
+        f"{settings.PEXELS_API_URL}/v1/search?query={city}+{state}&per_page=1"
+    )
 
     # identify auth
     headers = {
@@ -21,33 +43,118 @@ def get_image(city, state):
     }
 
     # make a request to site for data
-    res = requests.get(
+    res = http.get(
         url,
         headers=headers,
     )
+    res.raise_for_status()
 
     # get first image from pexel request
     return res.json()["photos"][0]["src"]["original"]
 
 
+def coord_key(city, state):
+    # a city's coordinates are the same whatever the case of its name
+    return (city.lower(), state.lower())
+
+
+def weather_key(lat, lon):
+    # nearby points share the same weather, so round the coordinates
+    # (2 decimal places is about a kilometer) to share cache entries
+    return (round(lat, 2), round(lon, 2))
+
+
 def get_coord(city, state):
+    try:
+        return coord_cache.get_or_set(
+            coord_key(city, state),
+            lambda: fetch_coord(city, state),
+        )
+    except UPSTREAM_ERRORS:
+        return None, None
 
-    # define url
-    url = f"http://api.openweathermap.org/geo/1.0/direct?q={city},{state}&limit={1}&appid={OPEN_WEATHER_API_KEY}"
 
-    # make a request to site for data (coorindates)
-    res = requests.get(url)
+async def aget_coord(city, state):
+    try:
+        return await coord_cache.aget_or_set(
+            coord_key(city, state),
+            lambda: afetch_coord(city, state),
+        )
+    except UPSTREAM_ERRORS:
+        return None, None
+
 
+def coord_url(city, state):
+    return f"{settings.OPEN_WEATHER_API_URL}/geo/1.0/direct?q={city},{state}&limit={1}&appid={OPEN_WEATHER_API_KEY}"
+
+
+def parse_coord(data):
     try:
         # get coordinates
-        lat = res.json()[0]["lat"]
-        lon = res.json()[0]["lon"]
+        lat = data[0]["lat"]
+        lon = data[0]["lon"]
         return lat, lon
     except IndexError:  # can't retrieve based on city, state
         return None, None
 
 
+def fetch_coord(city, state):
+
+    # make a request to site for data (coorindates)
+    res = http.get(coord_url(city, state))
+    res.raise_for_status()
+
+    return parse_coord(res.json())
+
+
+async def afetch_coord(city, state):
+
+    # same as fetch_coord, without blocking the event loop
+    res = await http.aget(coord_url(city, state))
+    res.raise_for_status()
+
+    return parse_coord(res.json())
+
+
 def get_weather(lat, lon):
+    key = weather_key(lat, lon)
+    try:
+        return weather_cache.get_or_set(key, lambda: fetch_weather(*key))
+    except UPSTREAM_ERRORS:
+        return None
+
+
+async def aget_weather(lat, lon):
+    key = weather_key(lat, lon)
+    try:
+        return await weather_cache.aget_or_set(
+            key,
+            lambda: afetch_weather(*key),
+        )
+    except UPSTREAM_ERRORS:
+        return None
+
+
+def weather_url(lat, lon):
+    return f"{settings.OPEN_WEATHER_API_URL}/data/2.5/weather?lat={lat}&lon={lon}&appid={OPEN_WEATHER_API_KEY}"
+
+
+def parse_weather(data):
+    # get weather data
+    try:
+        weather = data["weather"][0]
+    except (KeyError, IndexError):
+        return None
+
+    # adjust weather data with pop (to show only main, desc)
+    for i in ["id", "icon"]:
+        weather.pop(i)
+
+    # return weather
+    return weather
+
+
+def fetch_weather(lat, lon):
 
     """Create the URL for the geocoding API with the city and state
     Make the request
@@ -62,21 +169,17 @@ def get_weather(lat, lon):
       them in a dictionary
     Return the dictionary"""
 
-    # define url
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPEN_WEATHER_API_KEY}"
-
     # make a request to site for data (weather)
-    res = requests.get(url)
+    res = http.get(weather_url(lat, lon))
+    res.raise_for_status()
 
-    # get weather data
-    try:
-        weather = res.json()["weather"][0]
-    except (KeyError, IndexError):
-        weather = None
+    return parse_weather(res.json())
 
-    # adjust weather data with pop (to show only main, desc)
-    for i in ["id", "icon"]:
-        weather.pop(i)
 
-    # return weather
-    return weather
+async def afetch_weather(lat, lon):
+
+    # same as fetch_weather, without blocking the event loop
+    res = await http.aget(weather_url(lat, lon))
+    res.raise_for_status()
+
+    return parse_weather(res.json())
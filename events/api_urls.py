@@ -1,20 +1,49 @@
+from django.conf import settings
 from django.urls import path
 
 from .api_views import (
+    api_conference_bundle,
+    api_conference_stats,
     api_list_conferences,
     api_list_locations,
     api_show_conference,
     api_show_location,
 )
+from .async_views import (
+    async_api_list_locations,
+    async_api_show_conference,
+    async_api_show_location,
+)
+
+# serve the views that wait on external APIs asynchronously when
+# running under an ASGI server
+if settings.ASYNC_VIEWS:
+    show_conference = async_api_show_conference
+    list_locations = async_api_list_locations
+    show_location = async_api_show_location
+else:
+    show_conference = api_show_conference
+    list_locations = api_list_locations
+    show_location = api_show_location
 
 
 urlpatterns = [
     path("conferences/", api_list_conferences, name="api_list_conferences"),
     path(
         "conferences/<int:pk>/",
-        api_show_conference,
+        show_conference,
         name="api_show_conference",
     ),
-    path("locations/", api_list_locations, name="api_list_locations"),
-    path("locations/<int:pk>/", api_show_location, name="api_show_location"),
+    path(
+        "conferences/<int:pk>/bundle/",
+        api_conference_bundle,
+        name="api_conference_bundle",
+    ),
+    path(
+        "conferences/<int:pk>/stats/",
+        api_conference_stats,
+        name="api_conference_stats",
+    ),
+    path("locations/", list_locations, name="api_list_locations"),
+    path("locations/<int:pk>/", show_location, name="api_show_location"),
 ]
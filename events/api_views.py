@@ -1,22 +1,111 @@
 import json
+import time
+from contextvars import copy_context
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
 from django.views.decorators.http import require_http_methods
+from attendees.models import Attendee
+from common.cache import invalidate
+from common.responses import (
+    JsonResponse,
+    cache_response,
+    conditional_get,
+    get_encoder,
+    list_response,
+)
 from common.encoders import (
+    AttendeeListEncoder,
     ConferenceDetailEncoder,
     ConferenceListEncoder,
     LocationDetailEncoder,
     LocationListEncoder,
+    PresentationListEncoder,
 )
+from common.json import DateEncoder
+from presentations.models import Presentation, Status
 
-from .acl import get_coord, get_image, get_weather
+from .acl import get_coord, get_weather
 from .models import Conference, Location, State
+from .tasks import schedule_location_image, weather_executor
 
 # from json import JSONEncoder
 # from common.json import ModelEncoder
 
 
+def get_location_weather(location):
+    """
+    Returns the (lat, lon, weather) of a location, getting its coords
+    first if it hasn't been geocoded yet. Only calls the external APIs
+    (through their caches), not the database, so it can run in another
+    thread.
+    """
+    # coords are stored on the location; only locations that haven't
+    # been geocoded yet need the lookup
+    lat, lon = location.latitude, location.longitude
+    if lat is None or lon is None:
+        lat, lon = get_coord(location.city, location.state.name)
+
+    if lat is not None and lon is not None:
+        weather = get_weather(lat, lon)
+    else:
+        weather = None
+    return lat, lon, weather
+
+
+def store_coord(location, lat, lon):
+    # save the coords of a location that hadn't been geocoded (unless
+    # the geocoding failed, which is tried again on the next request)
+    if lat is None or lon is None:
+        return
+    if location.latitude is None or location.longitude is None:
+        Location.objects.filter(id=location.id).update(
+            latitude=lat,
+            longitude=lon,
+        )
+
+
+def conferences_versions():
+    # a change, an addition or a deletion changes one of these
+    versions = Conference.objects.aggregate(Max("updated"), Count("id"))
+    return list(versions.values())
+
+
+def conference_versions(pk):
+    versions = (
+        Conference.objects.filter(id=pk)
+        .values_list("updated", "location__updated")
+        .first()
+    )
+    if versions is None:
+        return None
+    # the weather in the response is only good for WEATHER_CACHE_TTL
+    # seconds, so the ETag changes at least that often too
+    weather_period = int(time.time() // settings.WEATHER_CACHE_TTL)
+    return [*versions, weather_period]
+
+
+def locations_versions():
+    versions = Location.objects.aggregate(Max("updated"), Count("id"))
+    return list(versions.values())
+
+
+def location_versions(pk):
+    updated = (
+        Location.objects.filter(id=pk)
+        .values_list("updated", flat=True)
+        .first()
+    )
+    if updated is None:
+        return None
+    return [updated]
+
+
 @require_http_methods(["GET", "POST"])
+@conditional_get(conferences_versions)
+@cache_response("conferences")
 def api_list_conferences(request):
     """
     Lists the conference names and the link to the conference.
@@ -42,11 +131,12 @@ def api_list_conferences(request):
     # Get a list of all of the instances of «resource»
     if request.method == "GET":
         # return json with instance parameters serialized to json
-        return JsonResponse(
-            # conferences,  # also works
-            {"conferences": conferences},
-            encoder=ConferenceListEncoder,
-            safe=False,
+        # (streamed when the client asks for it)
+        return list_response(
+            request,
+            "conferences",
+            conferences,
+            ConferenceListEncoder,
         )
 
     # Create a new instance of «resource» with the posted data
@@ -85,6 +175,8 @@ def api_list_conferences(request):
 
 
 @require_http_methods({"GET", "DELETE", "PUT"})
+@conditional_get(conference_versions)
+@cache_response("conference:{pk}", timeout=settings.WEATHER_CACHE_TTL)
 def api_show_conference(request, pk):
     """
     Returns the details for the Conference model specified
@@ -109,32 +201,20 @@ def api_show_conference(request, pk):
             "href": the URL for the location,
         }
     }
-    """
-    if request.method == "GET":
-        # get model instance given specific id
-        conference = Conference.objects.get(id=pk)
 
-        # get city, state from conference
-        city = conference.location.city
-        state = conference.location.state
+    With ?fields=name,... only those properties (and the href) are
+    loaded and returned.
 
-        # get coords
-        lat, lon = get_coord(city, state.name)
+    With ?expand=location the location's details are nested instead,
+    and with ?expand=location.state its state's too.
+    """
+    if request.method == "GET":
+        encoder, conference = get_conference(request, pk)
 
         # get weather data
-        if lat and lon:
-            weather = get_weather(lat, lon)
-        else:
-            weather = None
+        lat, lon, weather = get_location_weather(conference.location)
 
-        # return json with instance parameters serialized to json
-        # include weather data in jsonresponse (not in db instance)
-        return JsonResponse(
-            {"conference": conference, "weather": weather},
-            encoder=ConferenceDetailEncoder,
-            # encoder will only act on conference model instances
-            safe=False,
-        )
+        return conference_response(encoder, conference, lat, lon, weather)
 
     elif request.method == "DELETE":
         count, _ = Conference.objects.filter(id=pk).delete()
@@ -156,8 +236,14 @@ def api_show_conference(request, pk):
                 status=400,
             )
 
-        Conference.objects.filter(id=pk).update(**content)
+        # (update() doesn't set auto_now fields, so set "updated" here)
+        Conference.objects.filter(id=pk).update(
+            **content,
+            updated=timezone.now(),
+        )
         conference = Conference.objects.get(id=pk)
+        # update() doesn't send post_save
+        invalidate(*conference.cache_scopes())
 
         return JsonResponse(
             conference,
@@ -173,7 +259,209 @@ def api_show_conference(request, pk):
     # return JsonResponse(conference)
 
 
+def get_conference(request, pk):
+    """
+    Returns the encoder for a conference detail GET and the
+    conference, with its location (which the weather needs, whatever
+    the fields).
+    """
+    encoder = get_encoder(request, ConferenceDetailEncoder)
+    conference = (
+        Conference.objects.select_related("location__state")
+        .defer(*encoder.get_defer())
+        .get(id=pk)
+    )
+    return encoder, conference
+
+
+def conference_response(encoder, conference, lat, lon, weather):
+    """
+    Returns a conference detail GET's response, given the weather and
+    coords looked up for its location (so the async view can look
+    them up itself).
+    """
+    store_coord(conference.location, lat, lon)
+
+    # return json with instance parameters serialized to json
+    # include weather data in jsonresponse (not in db instance)
+    return JsonResponse(
+        {"conference": conference, "weather": weather},
+        encoder=encoder,
+        # encoder will only act on conference model instances
+        safe=False,
+    )
+
+
+@require_http_methods(["GET"])
+@cache_response(
+    "conference:{pk}",
+    "conference:{pk}:attendees",
+    "conference:{pk}:presentations",
+    timeout=settings.WEATHER_CACHE_TTL,
+)
+def api_conference_bundle(request, pk):
+    """
+    Returns everything a conference's page shows in one response: the
+    conference with its location's details, the weather there, and
+    the conference's attendees and presentations.
+
+    Takes three queries (the conference and location, then one for
+    each list), with the weather looked up in another thread while
+    the lists are loaded.
+
+    {
+        "conference": {
+            ...the conference's details, as in api_show_conference,
+            "location": {
+                ...the location's details, as in api_show_location
+            },
+        },
+        "weather": {
+            "main": the weather's short name,
+            "description": the weather's description,
+        } (or null when it couldn't be looked up),
+        "attendees": [
+            ...the attendees, as in api_list_attendees
+        ],
+        "presentations": [
+            ...the presentations, as in api_list_presentations
+        ],
+    }
+    """
+    encoder = ConferenceDetailEncoder.with_expand(["location"])
+    try:
+        # (with the location's coords, which the weather needs but the
+        # encoder doesn't output)
+        conference = encoder.prepare_queryset(
+            Conference.objects.all(),
+            "location__latitude",
+            "location__longitude",
+        ).get(id=pk)
+    except Conference.DoesNotExist:
+        return JsonResponse(
+            {"message": "Invalid conference id"},
+            status=404,
+        )
+    location = conference.location
+
+    # (in a copy of this request's context, so its time is counted in
+    # the request's metrics)
+    weather = weather_executor.submit(
+        copy_context().run, get_location_weather, location
+    )
+
+    # (the prefetches keep the conference column, which they're
+    # matched to the conference by)
+    prefetch_related_objects(
+        [conference],
+        Prefetch(
+            "attendees",
+            queryset=AttendeeListEncoder.prepare_queryset(
+                Attendee.objects.all(), "conference"
+            ),
+        ),
+        Prefetch(
+            "presentations",
+            queryset=PresentationListEncoder.prepare_queryset(
+                Presentation.objects.all(), "conference"
+            ),
+        ),
+    )
+
+    lat, lon, weather = weather.result()
+    store_coord(location, lat, lon)
+
+    return JsonResponse(
+        {
+            "conference": encoder().default(conference),
+            "weather": weather,
+            "attendees": [
+                AttendeeListEncoder().default(attendee)
+                for attendee in conference.attendees.all()
+            ],
+            "presentations": [
+                PresentationListEncoder().default(presentation)
+                for presentation in conference.presentations.all()
+            ],
+        },
+        encoder=DateEncoder,
+    )
+
+
+@require_http_methods(["GET"])
+@cache_control(max_age=settings.STATS_MAX_AGE)
+def api_conference_stats(request, pk):
+    """
+    Returns the attendee, badge and presentation counts of the
+    conference specified by the pk parameter, and how much of its
+    capacity is left. Counted by the database in three queries.
+
+    {
+        "attendees": {
+            "count": the number of attendees,
+            "badges": the number of attendees with a badge,
+            "max": the conference's max_attendees,
+            "remaining": the number of attendees left until the max,
+        },
+        "presentations": {
+            "count": the number of presentations,
+            "statuses": {status name: number of presentations, ...},
+            "max": the conference's max_presentations,
+            "remaining": the number of presentations left until the max,
+        },
+    }
+    """
+    conference = (
+        Conference.objects.filter(id=pk)
+        .values("max_attendees", "max_presentations")
+        .first()
+    )
+    if conference is None:
+        return JsonResponse(
+            {"message": "Invalid conference id"},
+            status=404,
+        )
+
+    attendees = Attendee.objects.filter(conference_id=pk).aggregate(
+        count=Count("id"),
+        badges=Count("badge"),
+    )
+
+    statuses = {status.name: 0 for status in Status.get_all()}
+    counts = (
+        Presentation.objects.filter(conference_id=pk)
+        .order_by()
+        .values_list("status__name")
+        .annotate(Count("id"))
+    )
+    for name, count in counts:
+        statuses[name] = count
+    presentation_count = sum(statuses.values())
+
+    return JsonResponse(
+        {
+            "attendees": {
+                **attendees,
+                "max": conference["max_attendees"],
+                "remaining": max(
+                    conference["max_attendees"] - attendees["count"], 0
+                ),
+            },
+            "presentations": {
+                "count": presentation_count,
+                "statuses": statuses,
+                "max": conference["max_presentations"],
+                "remaining": max(
+                    conference["max_presentations"] - presentation_count, 0
+                ),
+            },
+        }
+    )
+
+
 @require_http_methods(["GET", "POST"])
+@conditional_get(locations_versions)
+@cache_response("locations")
 def api_list_locations(request):
     """
     Lists the location names and the link to the location.
@@ -198,54 +486,67 @@ def api_list_locations(request):
 
     # if Gets a list of all of the instances of «resource»
     if request.method == "GET":
-        return JsonResponse(
-            # locations,
-            {"locations": locations},
-            encoder=LocationListEncoder,
-            safe=False,
+        return list_response(
+            request,
+            "locations",
+            locations,
+            LocationListEncoder,
         )
 
     # if Create a new instance of «resource» with the posted data
     elif request.method == "POST":
+        return create_location(request)
 
-        # 1. Decode JSON into dict
-        # create a location
-        content = json.loads(request.body)
 
-        # get the city and state from content
-        city = content["city"]
-        state = content["state"]
-
-        # get image
-        image_url = get_image(city, state)
-
-        # add image to new model (need to add field to actual
-        # location model first)
-        content["image_url"] = image_url
+def create_location(request, coord=None):
+    """
+    Creates a location from a POST's body and returns its details.
 
-        # Get the State object and put it in the content dict
-        try:
-            # 2. Translate properties into model objects
-            state = State.objects.get(abbreviation=content["state"])
-            content["state"] = state
+    coord is the (lat, lon) already looked up for the location's
+    city and state (by the async view), or None to look it up here.
+    """
+    # 1. Decode JSON into dict
+    # create a location
+    content = json.loads(request.body)
+
+    # get the city and state from content
+    city = content["city"]
+    state = content["state"]
+
+    # the image is looked up in the background once the location
+    # is saved (see events.tasks)
+    content["image_pending"] = True
+
+    # Get the State object and put it in the content dict
+    try:
+        # 2. Translate properties into model objects
+        state = State.get_by_abbreviation(content["state"])
+        content["state"] = state
+
+    # 3. Handle any errors that could happen
+    except State.DoesNotExist:
+        return JsonResponse(
+            {"message": "Invalid state abbreviation"},
+            status=404,
+        )
 
-        # 3. Handle any errors that could happen
-        except State.DoesNotExist:
-            return JsonResponse(
-                {"message": "Invalid state abbreviation"},
-                status=404,
-            )
+    # store the coordinates so conference details don't have to
+    # geocode the location again
+    if coord is None:
+        coord = get_coord(city, state.name)
+    content["latitude"], content["longitude"] = coord
 
-        # 4. Create new Entity instance
-        location = Location.objects.create(**content)  # TODO - understand
+    # 4. Create new Entity instance
+    location = Location.objects.create(**content)  # TODO - understand
+    schedule_location_image(location.id, city, state.abbreviation)
 
-        # 5. Return new entity in JsonResponse
-        return JsonResponse(
-            location, encoder=LocationDetailEncoder, safe=False
-        )
+    # 5. Return new entity in JsonResponse
+    return JsonResponse(location, encoder=LocationDetailEncoder, safe=False)
 
 
 @require_http_methods(["DELETE", "GET", "PUT"])
+@conditional_get(location_versions, last_modified=True)
+@cache_response("location:{pk}")
 def api_show_location(request, pk):
     """
     Returns the details for the Location model specified
@@ -261,15 +562,22 @@ def api_show_location(request, pk):
         "created": the date/time when the record was created,
         "updated": the date/time when the record was updated,
         "state": the two-letter abbreviation for the state,
+        "image_url": the URL of a picture of the location,
+        "image_pending": whether the picture is still being looked up,
     }
+
+    With ?fields=name,... only those properties (and the href) are
+    loaded and returned.
+
+    With ?expand=state the state's name and abbreviation are nested
+    instead of the abbreviation.
     """
 
     # if Gets the details of one instance of «resource»
     if request.method == "GET":
-        location = Location.objects.get(id=pk)
-        return JsonResponse(
-            location, encoder=LocationDetailEncoder, safe=False
-        )
+        encoder = get_encoder(request, LocationDetailEncoder)
+        location = encoder.prepare_queryset(Location.objects.all()).get(id=pk)
+        return JsonResponse(location, encoder=encoder, safe=False)
 
     elif request.method == "DELETE":
         count, _ = Location.objects.filter(id=pk).delete()
@@ -279,39 +587,57 @@ def api_show_location(request, pk):
 
     # if Updates the details of one instance of «resource» (PUT)
     elif request.method == "PUT":
-        # 1. Convert the submitted JSON-formatted string into a dictionary.
-        content = json.loads(request.body)
+        return update_location(request, pk)
 
-        # get the city and state from content
-        city = content["city"]
-        state = content["state"]
 
-        # get image
-        image_url = get_image(city, state)
+def update_location(request, pk, coord=None):
+    """
+    Updates a location from a PUT's body and returns its details.
 
-        # add image to new model (need to add field to actual
-        # location model first)
-        content["image_url"] = image_url
+    coord is as for create_location.
+    """
+    # 1. Convert the submitted JSON-formatted string into a dictionary.
+    content = json.loads(request.body)
 
-        # 2. Convert the state abbreviation into a State, if it exists.
-        try:
-            if "state" in content:
-                state = State.objects.get(abbreviation=content["state"])
-                content["state"] = state
-        except State.DoesNotExist:
-            return JsonResponse(
-                {"message": "Invalid state abbreviation"},
-                status=400,
-            )
+    # get the city and state from content
+    city = content["city"]
+    state = content["state"]
 
-        # 3. Use that dictionary to update the existing Location.
-        Location.objects.filter(id=pk).update(**content)
-        # .update(**content) inserts content into instance of model
+    # the image is looked up in the background once the location
+    # is saved (see events.tasks)
+    content["image_pending"] = True
 
-        # 4. Return the updated Location object.
-        location = Location.objects.get(id=pk)
+    # 2. Convert the state abbreviation into a State, if it exists.
+    try:
+        if "state" in content:
+            state = State.get_by_abbreviation(content["state"])
+            content["state"] = state
+    except State.DoesNotExist:
         return JsonResponse(
-            location,
-            encoder=LocationDetailEncoder,
-            safe=False,
+            {"message": "Invalid state abbreviation"},
+            status=400,
         )
+
+    # re-geocode the (possibly moved) location
+    if coord is None:
+        coord = get_coord(city, state.name)
+    content["latitude"], content["longitude"] = coord
+
+    # 3. Use that dictionary to update the existing Location.
+    Location.objects.filter(id=pk).update(
+        **content,
+        updated=timezone.now(),
+    )
+    # .update(**content) inserts content into instance of model
+    # (but doesn't set auto_now fields, so set "updated" here)
+    schedule_location_image(pk, city, state.abbreviation)
+
+    # 4. Return the updated Location object.
+    location = Location.objects.get(id=pk)
+    # update() doesn't send post_save
+    invalidate(*location.cache_scopes())
+    return JsonResponse(
+        location,
+        encoder=LocationDetailEncoder,
+        safe=False,
+    )
@@ -0,0 +1,103 @@
+import inspect
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseNotAllowed
+
+from common.responses import cache_response, conditional_get
+
+from .acl import aget_coord, aget_weather
+from .api_views import (
+    api_list_locations,
+    api_show_conference,
+    api_show_location,
+    conference_response,
+    conference_versions,
+    create_location,
+    get_conference,
+    update_location,
+)
+from .models import State
+
+# The async (ASGI) versions of the views that talk to external APIs.
+#
+# Each one does its external lookups on the event loop with the pooled
+# async client and passes the results to the sync view's helpers,
+# which run in a thread for the database work. So a request waiting on
+# OpenWeather doesn't hold a thread (nor, when the lookup fails, make
+# it again with the blocking client), and the views' behavior stays in
+# one place.
+
+# the sync view without its decorators, since async_api_show_conference
+# applies them itself (so that a 304 or a cached response doesn't wait
+# on OpenWeather)
+show_conference = inspect.unwrap(api_show_conference)
+
+
+@conditional_get(conference_versions)
+@cache_response("conference:{pk}", timeout=settings.WEATHER_CACHE_TTL)
+async def async_api_show_conference(request, pk):
+    if request.method not in ("GET", "DELETE", "PUT"):
+        return HttpResponseNotAllowed(["GET", "DELETE", "PUT"])
+
+    if request.method != "GET":
+        return await sync_to_async(show_conference)(request, pk)
+
+    encoder, conference = await sync_to_async(get_conference)(request, pk)
+    lat, lon, weather = await aget_location_weather(conference.location)
+    return await sync_to_async(conference_response)(
+        encoder, conference, lat, lon, weather
+    )
+
+
+async def async_api_list_locations(request):
+    if request.method == "POST":
+        coord = await fetch_location_coord(request)
+        return await sync_to_async(create_location)(request, coord)
+
+    return await sync_to_async(api_list_locations)(request)
+
+
+async def async_api_show_location(request, pk):
+    if request.method == "PUT":
+        coord = await fetch_location_coord(request)
+        return await sync_to_async(update_location)(request, pk, coord)
+
+    return await sync_to_async(api_show_location)(request, pk)
+
+
+async def aget_location_weather(location):
+    """
+    Like get_location_weather, awaiting the lookups on the event loop.
+    """
+    lat, lon = location.latitude, location.longitude
+    if lat is None or lon is None:
+        lat, lon = await aget_coord(location.city, location.state.name)
+
+    if lat is not None and lon is not None:
+        weather = await aget_weather(lat, lon)
+    else:
+        weather = None
+    return lat, lon, weather
+
+
+async def fetch_location_coord(request):
+    """
+    Returns the (lat, lon) of the city and state in a location's
+    POST or PUT body, or None when they can't be read (which the sync
+    view then reports).
+    """
+    try:
+        content = json.loads(request.body)
+        city = content["city"]
+        abbreviation = content["state"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    try:
+        state = await sync_to_async(State.get_by_abbreviation)(abbreviation)
+    except State.DoesNotExist:
+        return None
+
+    return await aget_coord(city, state.name)
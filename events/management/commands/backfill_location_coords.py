@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from events.acl import get_coord
+from events.models import Location
+
+
+class Command(BaseCommand):
+    help = "Geocodes the locations that don't have coordinates stored yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Geocode every location again, not only the missing ones",
+        )
+
+    def handle(self, *args, **options):
+        locations = Location.objects.select_related("state").only(
+            "city",
+            "state__name",
+        )
+        if not options["all"]:
+            locations = locations.filter(latitude__isnull=True)
+
+        # read them all first, so no cursor is held open during the
+        # lookups and updates
+        locations = list(locations)
+
+        updated = 0
+        for location in locations:
+            lat, lon = get_coord(location.city, location.state.name)
+            if lat is None or lon is None:
+                self.stderr.write(
+                    f"Couldn't geocode {location.city}, "
+                    f"{location.state.name} (location {location.id})"
+                )
+                continue
+
+            # update() so that the location's "updated" timestamp
+            # doesn't change
+            Location.objects.filter(id=location.id).update(
+                latitude=lat,
+                longitude=lon,
+            )
+            updated += 1
+
+        self.stdout.write(f"Geocoded {updated} location(s)")
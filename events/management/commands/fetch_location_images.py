@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from events.models import Location
+from events.tasks import fetch_location_image
+
+
+class Command(BaseCommand):
+    help = (
+        "Looks up the images of the locations still marked as pending "
+        "(e.g. when the process that queued them stopped first)"
+    )
+
+    def handle(self, *args, **options):
+        locations = (
+            Location.objects.filter(image_pending=True)
+            .select_related("state")
+            .only("city", "state__abbreviation")
+        )
+
+        # read them all first, so no cursor is held open during the
+        # lookups
+        locations = list(locations)
+        for location in locations:
+            fetch_location_image(
+                location.id,
+                location.city,
+                location.state.abbreviation,
+            )
+
+        self.stdout.write(f"Looked up {len(locations)} location image(s)")
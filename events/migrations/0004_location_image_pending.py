@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_location_latitude_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='image_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
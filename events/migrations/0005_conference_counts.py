@@ -0,0 +1,52 @@
+# Generated by Django 4.0.3 on 2026-10-18 15:57
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_for(model):
+    # the number of rows of model for the outer conference
+    return Coalesce(
+        Subquery(
+            model.objects.filter(conference=OuterRef('pk'))
+            .order_by()
+            .values('conference')
+            .annotate(count=Count('id'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def backfill_counts(apps, schema_editor):
+    Conference = apps.get_model('events', 'Conference')
+    Attendee = apps.get_model('attendees', 'Attendee')
+    Presentation = apps.get_model('presentations', 'Presentation')
+    Conference.objects.update(
+        attendee_count=count_for(Attendee),
+        presentation_count=count_for(Presentation),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_location_image_pending'),
+        ('attendees', '0001_initial'),
+        ('presentations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conference',
+            name='attendee_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conference',
+            name='presentation_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0005_conference_counts"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="state",
+            name="abbreviation",
+            field=models.CharField(db_index=True, max_length=2),
+        ),
+        migrations.AddIndex(
+            model_name="conference",
+            index=models.Index(
+                fields=["starts", "name", "id"],
+                name="conference_starts_name_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(
+                fields=["name", "id"], name="location_name_idx"
+            ),
+        ),
+    ]
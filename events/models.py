@@ -1,6 +1,12 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.urls import reverse
 
+from common.cache import LookupCache, invalidate_instance
+
 
 class State(models.Model):
     """
@@ -13,15 +19,23 @@ class State(models.Model):
 
     id = models.PositiveIntegerField(primary_key=True)
     name = models.CharField(max_length=20)
-    abbreviation = models.CharField(max_length=2)
+    abbreviation = models.CharField(max_length=2, db_index=True)
 
     def __str__(self):
         return f"{self.abbreviation}"
 
+    @classmethod
+    def get_by_abbreviation(cls, abbreviation):
+        # served from the process-local state_cache (no query)
+        return state_cache.get(abbreviation)
+
     class Meta:
         ordering = ("abbreviation",)  # Default ordering for State
 
 
+state_cache = LookupCache(State, "abbreviation")
+
+
 class Location(models.Model):
     """
     The Location model describes the place at which an
@@ -34,6 +48,13 @@ class Location(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
     image_url = models.URLField(null=True)  # need to add to encoder property
+    # True while the image is being looked up in the background
+    image_pending = models.BooleanField(default=False)
+
+    # geocoded from city and state when the location is saved through
+    # the API (see the backfill_location_coords command for old rows)
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
 
     state = models.ForeignKey(
         State,
@@ -44,11 +65,26 @@ class Location(models.Model):
     def get_api_url(self):
         return reverse("api_show_location", kwargs={"pk": self.pk})
 
+    def cache_scopes(self):
+        # the cached responses showing the location, including its
+        # conferences' details (attendee and presentation details can
+        # expand it too, and use "locations")
+        conference_ids = self.conferences.values_list("id", flat=True)
+        return [
+            "locations",
+            f"location:{self.pk}",
+            *(f"conference:{id}" for id in conference_ids),
+        ]
+
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ("name",)  # Default ordering for Location
+        indexes = [
+            # the list's ordering, with the pk that pagination adds
+            models.Index(fields=["name", "id"], name="location_name_idx"),
+        ]
 
 
 class Conference(models.Model):
@@ -68,17 +104,181 @@ class Conference(models.Model):
     max_presentations = models.PositiveSmallIntegerField()
     max_attendees = models.PositiveIntegerField()
 
+    # how many attendees and presentations the conference has, kept by
+    # reserve() and release() so checking capacity doesn't need a COUNT
+    attendee_count = models.PositiveIntegerField(default=0)
+    presentation_count = models.PositiveIntegerField(default=0)
+
     location = models.ForeignKey(
         Location,
         related_name="conferences",
         on_delete=models.CASCADE,
     )
 
+    # each counter and the field with its limit
+    CAPACITY_LIMITS = {
+        "attendee_count": "max_attendees",
+        "presentation_count": "max_presentations",
+    }
+
     def get_api_url(self):
         return reverse("api_show_conference", kwargs={"pk": self.pk})
 
+    def cache_scopes(self):
+        # the cached responses showing the conference (attendee and
+        # presentation details show it too, under "conference:{pk}")
+        return ["conferences", f"conference:{self.pk}"]
+
+    @classmethod
+    def reserve(cls, pk, counter, count=1):
+        """
+        Adds count to the conference's counter if that keeps it within
+        its limit, and returns whether it did.
+
+        The check and the increment are one conditional UPDATE, so two
+        requests can't both take the last place. Call it in the same
+        transaction as the insert, so a failed insert gives the place
+        back (ConferenceCountedModel does both).
+        """
+        limit = cls.CAPACITY_LIMITS[counter]
+        updated = cls.objects.filter(
+            id=pk,
+            **{f"{counter}__lte": F(limit) - count},
+        ).update(**{counter: F(counter) + count})
+        return updated > 0
+
+    @classmethod
+    def release(cls, pk, counter, count=1):
+        """
+        Takes count off the conference's counter when attendees or
+        presentations are deleted.
+        """
+        cls.objects.filter(id=pk, **{f"{counter}__gte": count}).update(
+            **{counter: F(counter) - count}
+        )
+
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ("starts", "name")  # Default ordering for Conference
+        indexes = [
+            # the list's ordering, with the pk that pagination adds
+            models.Index(
+                fields=["starts", "name", "id"],
+                name="conference_starts_name_idx",
+            ),
+        ]
+
+
+class ConferenceFull(Exception):
+    """
+    Raised when a conference has no room left for another attendee
+    or presentation.
+    """
+
+
+class ConferenceCountedQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Takes places for the new rows at their conferences and
+        inserts them, in one transaction. Raises ConferenceFull, with
+        nothing inserted, if a conference doesn't have room for all
+        of its rows.
+        """
+        objs = list(objs)
+        counts = Counter(o.conference_id for o in objs)
+        with transaction.atomic(using=self.db):
+            for conference_id, count in counts.items():
+                self.model.take_places(conference_id, count)
+            return super().bulk_create(objs, *args, **kwargs)
+
+
+class ConferenceCountedModel(models.Model):
+    """
+    An abstract model for rows that take up places at their
+    conference (attendees and presentations), counted in the
+    Conference field named by counter.
+
+    Saving a new row, or one moved to another conference, takes a
+    place there in the same transaction as the save, and raises
+    ConferenceFull when there's none left; so does bulk_create.
+    Deleting a row gives its place back (see release_place).
+    """
+
+    counter = None
+
+    objects = ConferenceCountedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the conference the row is counted at, to notice moves
+        instance._counted_conference_id = instance.__dict__.get(
+            "conference_id"
+        )
+        return instance
+
+    def get_conference_ids(self):
+        """
+        Returns the id of the row's conference and, while a save is
+        moving it to another one, the id of the one it's leaving (for
+        cache_scopes).
+        """
+        ids = [self.conference_id]
+        counted_at = getattr(self, "_counted_conference_id", None)
+        if counted_at is not None and counted_at != self.conference_id:
+            ids.append(counted_at)
+        return ids
+
+    @classmethod
+    def take_places(cls, conference_id, count=1):
+        if not Conference.reserve(conference_id, cls.counter, count):
+            raise ConferenceFull(f"Conference {conference_id} is full")
+
+    def save(self, *args, **kwargs):
+        counted_at = getattr(self, "_counted_conference_id", None)
+        update_fields = kwargs.get("update_fields")
+        moved = (
+            not self._state.adding
+            and counted_at is not None
+            and counted_at != self.conference_id
+            and (
+                update_fields is None
+                or {"conference", "conference_id"} & set(update_fields)
+            )
+        )
+        if not self._state.adding and not moved:
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic(using=kwargs.get("using")):
+            self.take_places(self.conference_id)
+            if moved:
+                Conference.release(counted_at, self.counter)
+            super().save(*args, **kwargs)
+        self._counted_conference_id = self.conference_id
+
+
+def release_place(sender, instance, origin=None, **kwargs):
+    """
+    A post_delete receiver for ConferenceCountedModel rows that gives
+    the row's place at its conference back.
+
+    Skipped when the delete cascaded from another model (the
+    conference, or its location): the conference is being deleted
+    too, and releasing each of its rows would be an UPDATE per row.
+    """
+    if origin is instance or (
+        isinstance(origin, models.QuerySet) and origin.model is sender
+    ):
+        Conference.release(instance.conference_id, sender.counter)
+
+
+post_save.connect(invalidate_instance, sender=Location)
+post_delete.connect(invalidate_instance, sender=Location)
+post_save.connect(invalidate_instance, sender=Conference)
+post_delete.connect(invalidate_instance, sender=Conference)
@@ -0,0 +1,68 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from common.cache import invalidate
+
+from .acl import get_image
+from .models import Location
+
+logger = logging.getLogger(__name__)
+
+# background workers that look up location images, so that creating or
+# updating a location doesn't wait on Pexels
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_FETCH_WORKERS,
+    thread_name_prefix="location-image",
+)
+
+# threads that look up the weather while a request runs its queries
+weather_executor = ThreadPoolExecutor(
+    max_workers=settings.WEATHER_FETCH_WORKERS,
+    thread_name_prefix="weather",
+)
+
+
+def schedule_location_image(location_id, city, state):
+    """
+    Queues the image lookup for a location once the current
+    transaction commits (so the worker can see the row).
+
+    The location should have been saved with image_pending=True.
+    """
+    transaction.on_commit(
+        lambda: executor.submit(run_in_worker, location_id, city, state)
+    )
+
+
+def run_in_worker(location_id, city, state):
+    try:
+        fetch_location_image(location_id, city, state)
+    finally:
+        # the worker threads aren't request threads, so nothing else
+        # closes their database connections
+        close_old_connections()
+
+
+def fetch_location_image(location_id, city, state):
+    """
+    Looks up the image for a location and stores it, clearing the
+    location's image_pending flag whether or not an image was found.
+    """
+    try:
+        image_url = get_image(city, state)
+    except (requests.RequestException, LookupError, ValueError):
+        logger.exception("Couldn't get an image for %s, %s", city, state)
+        image_url = None
+
+    # keep the old image if there's no new one (and mark the location
+    # as updated, since its details changed)
+    fields = {"image_pending": False, "updated": timezone.now()}
+    if image_url is not None:
+        fields["image_url"] = image_url
+    Location.objects.filter(id=location_id).update(**fields)
+    invalidate(*Location(id=location_id).cache_scopes())
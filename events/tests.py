@@ -0,0 +1,685 @@
+import asyncio
+import io
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+import uvicorn
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+
+from attendees.models import Attendee
+from common.encoders import (
+    AttendeeListEncoder,
+    ConferenceListEncoder,
+    LocationListEncoder,
+    PresentationListEncoder,
+)
+from common.pagination import paginate
+from presentations.models import Presentation, Status
+
+from .acl import aget_weather, coord_cache, get_weather, weather_cache
+from .async_views import (
+    async_api_list_locations,
+    async_api_show_conference,
+    async_api_show_location,
+)
+from .models import Conference, Location, State
+
+# the project's URLs, plus the async views next to the sync ones
+# (settings.ASYNC_VIEWS picks one when the URLs load)
+urlpatterns = [
+    path("async/conferences/<int:pk>/", async_api_show_conference),
+    path("async/locations/", async_api_list_locations),
+    path("async/locations/<int:pk>/", async_api_show_location),
+    path("", include("conference_go.urls")),
+]
+
+
+def create_conference(location, name="Conference"):
+    now = datetime.now(timezone.utc)
+    return Conference.objects.create(
+        name=name,
+        starts=now,
+        ends=now,
+        description="A conference",
+        max_presentations=100,
+        max_attendees=100,
+        location=location,
+    )
+
+
+class ConferenceDataMixin:
+    """
+    One location with one conference, that has one attendee and one
+    presentation, and add_rows() to add more of each.
+    """
+
+    def setUp(self):
+        caches[settings.API_CACHE].clear()
+        self.state = State.objects.create(
+            id=1,
+            name="Illinois",
+            abbreviation="IL",
+        )
+        self.status = Status.objects.create(id=1, name="SUBMITTED")
+        self.location = self.create_location("Hall 0")
+        self.conference = create_conference(self.location)
+        self.add_people(self.conference, 0)
+
+    def create_location(self, name):
+        return Location.objects.create(
+            name=name,
+            city="Chicago",
+            room_count=3,
+            state=self.state,
+        )
+
+    def add_people(self, conference, i):
+        Attendee.objects.create(
+            email=f"attendee{i}@example.com",
+            name=f"Attendee {i}",
+            conference=conference,
+        )
+        Presentation.objects.create(
+            presenter_name=f"Presenter {i}",
+            presenter_email=f"presenter{i}@example.com",
+            title=f"Talk {i}",
+            synopsis="A talk",
+            status=self.status,
+            conference=conference,
+        )
+
+    def add_rows(self, count):
+        for i in range(1, count + 1):
+            location = self.create_location(f"Hall {i}")
+            create_conference(location, f"Conference {i}")
+            self.add_people(self.conference, i)
+
+
+class ListQueryCountTests(ConferenceDataMixin, TestCase):
+    def get_list_urls(self):
+        return {
+            f"/api/conferences/{self.conference.id}/attendees/": 1,
+            f"/api/conferences/{self.conference.id}/presentations/": 1,
+            # (plus the query for the list's ETag)
+            "/api/conferences/": 2,
+            "/api/locations/": 2,
+        }
+
+    def assert_list_queries(self, rows):
+        for url, queries in self.get_list_urls().items():
+            caches[settings.API_CACHE].clear()
+            with self.subTest(url=url, rows=rows):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                key = url.rstrip("/").rsplit("/", 1)[-1]
+                self.assertEqual(len(response.json()[key]), rows)
+
+    def test_one_row(self):
+        self.assert_list_queries(1)
+
+    def test_many_rows(self):
+        self.add_rows(20)
+        self.assert_list_queries(21)
+
+
+@override_settings(API_STREAM_CHUNK_SIZE=2)
+class StreamingListTests(ConferenceDataMixin, TestCase):
+    url = "/api/locations/"
+
+    def setUp(self):
+        super().setUp()
+        self.add_rows(4)
+        self.expected = self.client.get(self.url).json()
+        self.assertEqual(len(self.expected["locations"]), 5)
+
+    def test_streams_the_same_json_in_chunks(self):
+        response = self.client.get(self.url, {"stream": "true"})
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        # the opening, three chunks of rows and the closing
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b"".join(chunks)), self.expected)
+
+    @override_settings(API_STREAM_LISTS=True)
+    def test_stream_setting_and_parameter(self):
+        caches[settings.API_CACHE].clear()
+        self.assertTrue(self.client.get(self.url).streaming)
+        response = self.client.get(self.url, {"stream": "false"})
+        self.assertFalse(response.streaming)
+
+    async def test_not_streamed_under_asgi(self):
+        response = await self.async_client.get(self.url, {"stream": "true"})
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.json(), self.expected)
+
+
+class QueryPlanTests(ConferenceDataMixin, TestCase):
+    """
+    Checks that the list views' queries (whole lists, and first and
+    later pages) are answered from indexes: no scans of a table
+    without an index and no sorts in a temporary B-tree.
+    """
+
+    def get_querysets(self):
+        return [
+            ConferenceListEncoder.prepare_queryset(Conference.objects.all()),
+            LocationListEncoder.prepare_queryset(Location.objects.all()),
+            AttendeeListEncoder.prepare_queryset(
+                Attendee.objects.filter(conference=self.conference.id)
+            ),
+            PresentationListEncoder.prepare_queryset(
+                Presentation.objects.filter(conference=self.conference.id)
+            ),
+        ]
+
+    def get_queries(self, queryset):
+        # the whole list, then the first two pages
+        yield queryset.query.sql_with_params()
+        path = "/?limit=2"
+        for page in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                _, path = paginate(RequestFactory().get(path), queryset)
+            for query in queries:
+                yield query["sql"], ()
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def test_list_queries_use_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("checks SQLite's query plans")
+
+        self.add_rows(5)
+        for queryset in self.get_querysets():
+            for sql, params in self.get_queries(queryset):
+                plan = self.explain(sql, params)
+                with self.subTest(sql=sql):
+                    for step in plan:
+                        self.assertNotIn("TEMP B-TREE", step)
+                        if step.startswith("SCAN "):
+                            self.assertIn("INDEX", step)
+
+
+@override_settings(ROOT_URLCONF="events.tests")
+@mock.patch(
+    "events.api_views.get_location_weather",
+    return_value=(41.0, -87.0, None),
+)
+class ConditionalGetTests(ConferenceDataMixin, TestCase):
+    def assert_not_modified(self, url, response):
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_IF_NONE_MATCH=response["ETag"]
+            ).status_code,
+            304,
+        )
+
+    def test_lists_only_send_etag(self, get_location_weather):
+        for url in ("/api/conferences/", "/api/locations/"):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn("ETag", response)
+                self.assertNotIn("Last-Modified", response)
+                self.assert_not_modified(url, response)
+
+    def test_deleted_location_changes_list_etag(self, get_location_weather):
+        other = self.create_location("Hall 1")
+        response = self.client.get("/api/locations/")
+        other.delete()
+        self.assertEqual(
+            self.client.get(
+                "/api/locations/",
+                HTTP_IF_NONE_MATCH=response["ETag"],
+            ).status_code,
+            200,
+        )
+
+    def test_conference_only_sends_etag(self, get_location_weather):
+        url = f"/api/conferences/{self.conference.id}/"
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+        self.assert_not_modified(url, response)
+
+    def test_location_sends_last_modified(self, get_location_weather):
+        url = f"/api/locations/{self.location.id}/"
+        response = self.client.get(url)
+        self.assertIn("Last-Modified", response)
+        self.assertEqual(
+            self.client.get(
+                url,
+                HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+            ).status_code,
+            304,
+        )
+
+    @mock.patch(
+        "events.async_views.aget_location_weather",
+        return_value=(41.0, -87.0, None),
+    )
+    async def test_async_conference_checks_before_weather(
+        self,
+        aget_location_weather,
+        get_location_weather,
+    ):
+        url = f"/async/conferences/{self.conference.id}/"
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aget_location_weather.await_count, 1)
+
+        # a 304, then a response from the cache
+        # (the async client takes headers without the HTTP_ prefix)
+        response = await self.async_client.get(
+            url,
+            IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(aget_location_weather.await_count, 1)
+
+
+@mock.patch("events.api_views.get_weather", return_value=None)
+@mock.patch("events.api_views.get_coord", return_value=(41.0, -87.0))
+class StoredCoordTests(ConferenceDataMixin, TestCase):
+    def get_conference(self):
+        caches[settings.API_CACHE].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                f"/api/conferences/{self.conference.id}/"
+            )
+        self.assertEqual(response.status_code, 200)
+        return [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+
+    def test_stores_coords_once(self, get_coord, get_weather):
+        self.assertEqual(len(self.get_conference()), 1)
+        self.location.refresh_from_db()
+        self.assertEqual(
+            (self.location.latitude, self.location.longitude),
+            (41.0, -87.0),
+        )
+        get_weather.assert_called_with(41.0, -87.0)
+
+        self.assertEqual(self.get_conference(), [])
+        self.assertEqual(get_coord.call_count, 1)
+
+    def test_failed_geocode_isnt_stored(self, get_coord, get_weather):
+        get_coord.return_value = (None, None)
+        self.assertEqual(self.get_conference(), [])
+        get_weather.assert_not_called()
+
+        # (tried again on the next request)
+        self.get_conference()
+        self.assertEqual(get_coord.call_count, 2)
+
+    @mock.patch(
+        "events.management.commands.backfill_location_coords.get_coord"
+    )
+    def test_backfill(self, backfill_get_coord, get_coord, get_weather):
+        other = self.create_location("Hall 1")
+        other.city = "Nowhere"
+        other.save()
+        backfill_get_coord.side_effect = lambda city, state: (
+            (41.0, -87.0) if city == "Chicago" else (None, None)
+        )
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("backfill_location_coords", stdout=stdout, stderr=stderr)
+        self.assertIn("Geocoded 1 location(s)", stdout.getvalue())
+        self.assertIn("Couldn't geocode Nowhere, Illinois", stderr.getvalue())
+
+        self.location.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.location.latitude, 41.0)
+        self.assertIsNone(other.latitude)
+
+
+@mock.patch("events.api_views.get_weather", return_value=None)
+@mock.patch("events.api_views.get_coord", return_value=(41.0, -87.0))
+class ConferenceBundleTests(ConferenceDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/conferences/{self.conference.id}/bundle/"
+
+    def test_three_queries(self, get_coord, get_weather):
+        Location.objects.filter(id=self.location.id).update(
+            latitude=41.0, longitude=-87.0
+        )
+        # (the weather thread doesn't query either: it's given the
+        # location's coords with the conference)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        get_coord.assert_not_called()
+        get_weather.assert_called_once_with(41.0, -87.0)
+
+        body = response.json()
+        self.assertEqual(body["conference"]["location"]["name"], "Hall 0")
+        self.assertEqual(len(body["attendees"]), 1)
+        self.assertEqual(len(body["presentations"]), 1)
+
+    def test_stores_coords(self, get_coord, get_weather):
+        # plus the update storing the looked up coords
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+        self.location.refresh_from_db()
+        self.assertEqual(self.location.latitude, 41.0)
+
+
+@mock.patch("events.api_views.get_coord", return_value=(41.0, -87.0))
+class LocationImageTests(TransactionTestCase):
+    """
+    Creates locations, whose images are looked up by the worker
+    threads after the response.
+    """
+
+    def setUp(self):
+        caches[settings.API_CACHE].clear()
+        State.objects.create(id=1, name="Illinois", abbreviation="IL")
+
+    def create_location(self):
+        response = self.client.post(
+            "/api/locations/",
+            {
+                "name": "Hall",
+                "city": "Chicago",
+                "room_count": 3,
+                "state": "IL",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["image_pending"])
+        return response.json()["href"]
+
+    def wait_for_image(self, url):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            location = self.client.get(url).json()
+            if not location["image_pending"]:
+                return location
+            time.sleep(0.01)
+        self.fail("The image lookup didn't finish")
+
+    @mock.patch("events.tasks.get_image", return_value="http://img/1.jpg")
+    def test_image_is_stored_by_worker(self, get_image, get_coord):
+        location = self.wait_for_image(self.create_location())
+        self.assertEqual(location["image_url"], "http://img/1.jpg")
+        get_image.assert_called_once_with("Chicago", "IL")
+
+    @mock.patch("events.tasks.get_image", side_effect=LookupError)
+    def test_failed_lookup_clears_pending(self, get_image, get_coord):
+        with self.assertLogs("events.tasks", "ERROR"):
+            location = self.wait_for_image(self.create_location())
+        self.assertIsNone(location["image_url"])
+
+
+@override_settings(ROOT_URLCONF="events.tests")
+@mock.patch("events.acl.http.get")
+class AsyncViewTests(ConferenceDataMixin, TestCase):
+    """
+    Checks that the async views only make their lookups with the async
+    client, even when they fail.
+    """
+
+    def setUp(self):
+        super().setUp()
+        coord_cache.clear()
+        weather_cache.clear()
+
+    @mock.patch("events.acl.http.aget", side_effect=httpx.ConnectError("x"))
+    async def test_failed_lookups_arent_made_again(self, aget, get):
+        response = await self.async_client.get(
+            f"/async/conferences/{self.conference.id}/"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()["weather"])
+        # just the geocoding, which the weather needs
+        self.assertEqual(aget.await_count, 1)
+        get.assert_not_called()
+
+    @mock.patch("events.async_views.aget_coord", return_value=(42.0, -88.0))
+    async def test_location_coords_are_passed_on(self, aget_coord, get):
+        body = {"name": "Hall", "city": "Evanston", "room_count": 3}
+        response = await self.async_client.post(
+            "/async/locations/",
+            {**body, "state": "IL"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        url = response.json()["href"].replace("/api/", "/async/")
+
+        response = await self.async_client.put(
+            url,
+            {**body, "city": "Skokie", "state": "IL"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            aget_coord.await_args_list,
+            [
+                mock.call("Evanston", "Illinois"),
+                mock.call("Skokie", "Illinois"),
+            ],
+        )
+        get.assert_not_called()
+
+        location = await Location.objects.aget(name="Hall")
+        self.assertEqual(
+            (location.latitude, location.longitude), (42.0, -88.0)
+        )
+
+
+class SlowWeatherHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the OpenWeather API that takes delay seconds to
+    answer each request.
+    """
+
+    delay = 0.3
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.server.hits += 1
+        body = json.dumps(
+            {
+                "weather": [
+                    {
+                        "id": 800,
+                        "main": "Clear",
+                        "description": "clear sky",
+                        "icon": "01d",
+                    }
+                ]
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_thread(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def start_upstream(handler):
+    """
+    Starts a stub upstream API server in a thread, counting the
+    requests it answers in its hits attribute.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.hits = 0
+    start_thread(server.serve_forever)
+    return server
+
+
+class WeatherCacheTests(SimpleTestCase):
+    """
+    Looks up the weather at one place many times at once, against a
+    slow stub of the OpenWeather API.
+    """
+
+    lookups = 10
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.upstream = start_upstream(SlowWeatherHandler)
+        cls.addClassCleanup(cls.upstream.shutdown)
+
+    def setUp(self):
+        weather_cache.clear()
+        upstream_url = "http://127.0.0.1:%d" % self.upstream.server_port
+        self.enterContext(self.settings(OPEN_WEATHER_API_URL=upstream_url))
+        self.hits = self.upstream.hits
+
+    def assert_one_hit(self, results):
+        expected = {"main": "Clear", "description": "clear sky"}
+        self.assertEqual(results, [expected] * self.lookups)
+        self.assertEqual(self.upstream.hits - self.hits, 1)
+
+    def test_concurrent_lookups_fetch_once(self):
+        with ThreadPoolExecutor(self.lookups) as executor:
+            results = list(
+                executor.map(
+                    lambda i: get_weather(41.0, -87.0),
+                    range(self.lookups),
+                )
+            )
+        self.assert_one_hit(results)
+
+        # nearby places share the cached weather
+        get_weather(41.001, -87.001)
+        self.assertEqual(self.upstream.hits - self.hits, 1)
+
+    def test_concurrent_async_lookups_fetch_once(self):
+        async def lookups():
+            return await asyncio.gather(
+                *(aget_weather(41.0, -87.0) for i in range(self.lookups))
+            )
+
+        self.assert_one_hit(asyncio.run(lookups()))
+
+
+@override_settings(ROOT_URLCONF="events.tests", ALLOWED_HOSTS=["*"])
+class ConferenceWeatherLoadTests(TransactionTestCase):
+    """
+    Requests the details of conferences at different locations all
+    at once from uvicorn, with a slow weather API, through the sync
+    view and through its async version.
+    """
+
+    conferences = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        cls.upstream = start_upstream(SlowWeatherHandler)
+        cls.addClassCleanup(cls.upstream.shutdown)
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        cls.live_url = "http://127.0.0.1:%d" % sock.getsockname()[1]
+        cls.server = uvicorn.Server(
+            uvicorn.Config(
+                get_asgi_application(),
+                lifespan="off",
+                log_level="warning",
+            )
+        )
+        thread = start_thread(lambda: cls.server.run(sockets=[sock]))
+        while not cls.server.started:
+            time.sleep(0.01)
+
+        def stop_server():
+            cls.server.should_exit = True
+            thread.join()
+
+        cls.addClassCleanup(stop_server)
+
+    def setUp(self):
+        caches[settings.API_CACHE].clear()
+        weather_cache.clear()
+        upstream_url = "http://127.0.0.1:%d" % self.upstream.server_port
+        self.enterContext(self.settings(OPEN_WEATHER_API_URL=upstream_url))
+
+        state = State.objects.create(id=1, name="Illinois", abbreviation="IL")
+        self.pks = []
+        for i in range(self.conferences):
+            location = Location.objects.create(
+                name=f"Hall {i}",
+                city="Chicago",
+                room_count=3,
+                state=state,
+                latitude=41.0 + i,
+                longitude=-87.0,
+            )
+            self.pks.append(create_conference(location).pk)
+
+    def load(self, path):
+        """
+        Requests path for every conference at once and returns how
+        long it took for all of them to be answered.
+        """
+
+        async def requests():
+            async with httpx.AsyncClient(timeout=60) as client:
+                return await asyncio.gather(
+                    *(
+                        client.get(f"{self.live_url}{path % pk}")
+                        for pk in self.pks
+                    )
+                )
+
+        hits = self.upstream.hits
+        start = time.perf_counter()
+        responses = asyncio.run(requests())
+        elapsed = time.perf_counter() - start
+
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["weather"]["main"], "Clear")
+        self.assertEqual(self.upstream.hits - hits, self.conferences)
+        return elapsed
+
+    def test_async_view_waits_on_the_weather_concurrently(self):
+        sync = self.load("/api/conferences/%d/")
+        weather_cache.clear()
+        caches[settings.API_CACHE].clear()
+        async_ = self.load("/async/conferences/%d/")
+
+        # the requests' waits on the weather overlap instead of adding
+        # up (without a thread for each wait, unlike the sync view)
+        serial = self.conferences * SlowWeatherHandler.delay
+        self.assertLess(async_, serial / 2, f"sync view: {sync:.2f}s")
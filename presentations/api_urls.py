@@ -1,6 +1,10 @@
 from django.urls import path
 
-from .api_views import api_list_presentations, api_show_presentation
+from .api_views import (
+    api_list_presentations,
+    api_review_presentations,
+    api_show_presentation,
+)
 
 
 urlpatterns = [
@@ -9,6 +13,11 @@ urlpatterns = [
         api_list_presentations,
         name="api_list_presentations",
     ),
+    path(
+        "conferences/<int:conference_id>/presentations/review/",
+        api_review_presentations,
+        name="api_review_presentations",
+    ),
     path(
         "presentations/<int:pk>/",
         api_show_presentation,
@@ -1,14 +1,20 @@
 import json
 
-from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from common.encoders import PresentationDetailEncoder, PresentationListEncoder
-from events.models import Conference
+from common.responses import (
+    JsonResponse,
+    cache_response,
+    get_encoder,
+    list_response,
+)
+from events.models import Conference, ConferenceFull
 
-from .models import Presentation
+from .models import Presentation, Status
 
 
 @require_http_methods(["GET", "POST"])
+@cache_response("conference:{conference_id}:presentations")
 def api_list_presentations(request, conference_id):
     """
     Lists the presentation titles and the link to the
@@ -36,10 +42,11 @@ def api_list_presentations(request, conference_id):
 
     if request.method == "GET":
         # return json with instance parameters serialized to json
-        return JsonResponse(
-            {"presentations": presentations},
-            encoder=PresentationListEncoder,
-            safe=False,
+        return list_response(
+            request,
+            "presentations",
+            presentations,
+            PresentationListEncoder,
         )
 
     elif request.method == "POST":
@@ -54,7 +61,14 @@ def api_list_presentations(request, conference_id):
                 status=400,
             )
 
-        presentation = Presentation.create(**content)
+        # (saving it takes a slot at the conference)
+        try:
+            presentation = Presentation.create(**content)
+        except ConferenceFull:
+            return JsonResponse(
+                {"message": "Conference is full"},
+                status=409,
+            )
 
         return JsonResponse(
             presentation,
@@ -73,7 +87,64 @@ def api_list_presentations(request, conference_id):
     # return JsonResponse({"presentations": presentations})
 
 
+@require_http_methods(["POST"])
+def api_review_presentations(request, conference_id):
+    """
+    Approves or rejects many presentations of the specified
+    conference at once.
+
+    Takes the ids of the presentations and the status to move
+    them to:
+
+    {
+        "presentations": [presentation id, ...],
+        "status": "APPROVED" or "REJECTED",
+    }
+
+    Presentations that aren't SUBMITTED (or aren't part of the
+    conference) are skipped. Returns the counts:
+
+    {
+        "updated": number of presentations changed,
+        "skipped": number of ids that weren't changed,
+    }
+    """
+    try:
+        content = json.loads(request.body)
+    except ValueError:
+        content = None
+    if not isinstance(content, dict):
+        return JsonResponse(
+            {"message": "Expected a JSON object"},
+            status=400,
+        )
+
+    ids = content.get("presentations")
+    if not isinstance(ids, list) or not all(isinstance(id, int) for id in ids):
+        return JsonResponse(
+            {"message": "Invalid presentation ids"},
+            status=400,
+        )
+
+    try:
+        updated = Presentation.review(
+            ids,
+            content.get("status"),
+            conference_id=conference_id,
+        )
+    except (ValueError, Status.DoesNotExist):
+        return JsonResponse(
+            {"message": "Invalid status"},
+            status=400,
+        )
+
+    return JsonResponse(
+        {"updated": updated, "skipped": len(set(ids)) - updated}
+    )
+
+
 @require_http_methods(["GET", "DELETE", "PUT"])
+@cache_response("presentation:{pk}")
 def api_show_presentation(request, pk):
     """
     Returns the details for the Presentation model specified
@@ -98,18 +169,31 @@ def api_show_presentation(request, pk):
             "href": the URL to the conference,
         }
     }
+
+    With ?fields=name,... only those properties (and the href) are
+    loaded and returned.
+
+    With ?expand=conference the conference's details are nested
+    instead (and ?expand=conference.location adds its location's).
     """
 
     if request.method == "GET":
         # get model instance given specific id
-        presentation = Presentation.objects.get(id=pk)
+        encoder = get_encoder(request, PresentationDetailEncoder)
+        # (loading the conference id even with ?fields=, for the scope)
+        presentation = encoder.prepare_queryset(
+            Presentation.objects.all(), "conference"
+        ).get(id=pk)
 
         # return json with instance parameters serialized to json
-        return JsonResponse(
+        response = JsonResponse(
             presentation,
-            encoder=PresentationDetailEncoder,
+            encoder=encoder,
             safe=False,
         )
+        # (it shows the conference, and with ?expand= its location)
+        response.cache_scopes = [f"conference:{presentation.conference_id}"]
+        return response
 
     elif request.method == "DELETE":
         count, _ = Presentation.objects.filter(id=pk).delete()
@@ -121,9 +205,30 @@ def api_show_presentation(request, pk):
     elif request.method == "PUT":
         content = json.loads(request.body)
 
-        Presentation.objects.filter(id=pk).update(**content)
-
+        if "conference" in content:
+            if not Conference.objects.filter(
+                id=content["conference"]
+            ).exists():
+                return JsonResponse(
+                    {"message": "Invalid conference id"},
+                    status=400,
+                )
+
+        # save() rather than update(), so that moving the presentation
+        # to another conference takes a slot there (and gives the old
+        # one back)
         presentation = Presentation.objects.filter(id=pk)
+        for p in presentation:
+            for name, value in content.items():
+                field = Presentation._meta.get_field(name)
+                setattr(p, field.attname, value)
+            try:
+                p.save()
+            except ConferenceFull:
+                return JsonResponse(
+                    {"message": "Conference is full"},
+                    status=409,
+                )
 
         return JsonResponse(
             presentation,
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("presentations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="status",
+            name="name",
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name="presentation",
+            index=models.Index(
+                fields=["conference", "title", "id"],
+                name="presentation_conf_title_idx",
+            ),
+        ),
+    ]
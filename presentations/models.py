@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.urls import reverse
 
+from common.cache import LookupCache, invalidate, invalidate_instance
+from events.models import ConferenceCountedModel, release_place
+
 
 class Status(models.Model):
     """
@@ -12,22 +16,36 @@ class Status(models.Model):
     """
 
     id = models.PositiveSmallIntegerField(primary_key=True)
-    name = models.CharField(max_length=10)
+    name = models.CharField(max_length=10, db_index=True)
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_by_name(cls, name):
+        # served from the process-local status_cache (no query)
+        return status_cache.get(name)
+
+    @classmethod
+    def get_all(cls):
+        return status_cache.all()
+
     class Meta:
         ordering = ("id",)  # Default ordering for Status
         verbose_name_plural = "statuses"  # Fix the pluralization
 
 
-class Presentation(models.Model):
+status_cache = LookupCache(Status, "name")
+
+
+class Presentation(ConferenceCountedModel):
     """
     The Presentation model represents a presentation that a person
     wants to give at the conference.
     """
 
+    counter = "presentation_count"
+
     presenter_name = models.CharField(max_length=150)
     company_name = models.CharField(max_length=150, null=True, blank=True)
     presenter_email = models.EmailField()
@@ -48,30 +66,98 @@ class Presentation(models.Model):
         on_delete=models.CASCADE,
     )
 
+    # the statuses a review can move a presentation to, each with the
+    # statuses the presentation has to be in for that
+    REVIEW_TRANSITIONS = {
+        "APPROVED": ("SUBMITTED",),
+        "REJECTED": ("SUBMITTED",),
+    }
+
     def get_api_url(self):
         return reverse("api_show_presentation", kwargs={"pk": self.pk})
 
+    def cache_scopes(self):
+        return [
+            f"presentation:{self.pk}",
+            *(
+                f"conference:{id}:presentations"
+                for id in self.get_conference_ids()
+            ),
+        ]
+
     def __str__(self):
         return self.title
 
     def approve(self):
-        status = Status.objects.get(name="APPROVED")
+        status = Status.get_by_name("APPROVED")
         self.status = status
         # self.status.update(status)  # doesn't work?
-        self.save()
+        self.save(update_fields=["status"])
 
     def reject(self):
-        status = Status.objects.get(name="REJECTED")
+        status = Status.get_by_name("REJECTED")
         self.status = status
         # self.status.update(status)  # doesn't work?
-        self.save()
+        self.save(update_fields=["status"])
+
+    @classmethod
+    def review(cls, ids, status_name, conference_id=None):
+        """
+        Moves the presentations with the given ids (of the given
+        conference, if any) to the named status with a single
+        UPDATE. Presentations whose current status doesn't allow
+        the move (see REVIEW_TRANSITIONS) are left alone by the
+        same statement.
+
+        Returns the number of presentations changed. Raises
+        ValueError for a status that reviews can't move to.
+        """
+        if status_name not in cls.REVIEW_TRANSITIONS:
+            raise ValueError(f"Can't review to {status_name!r}")
+
+        status = Status.get_by_name(status_name)
+        allowed = [
+            Status.get_by_name(name).id
+            for name in cls.REVIEW_TRANSITIONS[status_name]
+        ]
+
+        presentations = cls.objects.filter(id__in=ids, status_id__in=allowed)
+        if conference_id is not None:
+            presentations = presentations.filter(conference_id=conference_id)
+            conference_ids = [conference_id]
+        else:
+            conference_ids = set(
+                presentations.values_list("conference_id", flat=True)
+            )
+
+        count = presentations.update(status=status)
+        # update() doesn't send post_save
+        if count:
+            invalidate(
+                *(f"presentation:{id}" for id in ids),
+                *(f"conference:{id}:presentations" for id in conference_ids),
+            )
+        return count
 
     @classmethod  # TODO - understand
     def create(cls, **kwargs):
-        kwargs["status"] = Status.objects.get(name="SUBMITTED")
+        kwargs["status"] = Status.get_by_name("SUBMITTED")
         presentation = cls(**kwargs)
         presentation.save()
         return presentation
 
     class Meta:
         ordering = ("title",)  # Default ordering for presentation
+        indexes = [
+            # a conference's presentations in the list's ordering, with
+            # the pk that pagination adds
+            models.Index(
+                fields=["conference", "title", "id"],
+                name="presentation_conf_title_idx",
+            ),
+        ]
+
+
+post_delete.connect(release_place, sender=Presentation)
+post_save.connect(invalidate_instance, sender=Presentation)
+post_delete.connect(invalidate_instance, sender=Presentation)
@@ -0,0 +1,145 @@
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from events.tests import ConferenceDataMixin, create_conference
+
+from .models import Presentation, Status
+
+
+class PresentationCountTests(ConferenceDataMixin, TestCase):
+    def test_moving_a_presentation_moves_the_slot(self):
+        other = create_conference(self.location, "Other")
+        presentation = self.conference.presentations.get()
+        response = self.client.put(
+            f"/api/presentations/{presentation.id}/",
+            json.dumps({"conference": other.id, "title": "Moved"}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["title"], "Moved")
+
+        self.conference.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.conference.presentation_count, 0)
+        self.assertEqual(other.presentation_count, 1)
+
+    def test_invalid_conference(self):
+        presentation = self.conference.presentations.get()
+        response = self.client.put(
+            f"/api/presentations/{presentation.id}/",
+            json.dumps({"conference": 999}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class PresentationReviewTests(ConferenceDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Status.objects.create(id=2, name="APPROVED")
+        Status.objects.create(id=3, name="REJECTED")
+        self.add_rows(3)
+        self.ids = list(
+            self.conference.presentations.values_list("id", flat=True)
+        )
+        self.url = (
+            f"/api/conferences/{self.conference.id}/presentations/review/"
+        )
+
+    def review(self, body):
+        return self.client.post(
+            self.url,
+            json.dumps(body) if not isinstance(body, str) else body,
+            content_type="application/json",
+        )
+
+    def get_status(self, id):
+        return self.client.get(f"/api/presentations/{id}/").json()["status"]
+
+    def test_moves_submitted_presentations(self):
+        self.assertEqual(self.get_status(self.ids[0]), "SUBMITTED")
+        response = self.review(
+            {"presentations": self.ids[:2], "status": "APPROVED"}
+        )
+        self.assertEqual(response.json(), {"updated": 2, "skipped": 0})
+        # (the cached details are invalidated)
+        self.assertEqual(self.get_status(self.ids[0]), "APPROVED")
+        self.assertEqual(self.get_status(self.ids[2]), "SUBMITTED")
+
+    def test_skips_disallowed_transitions(self):
+        self.review({"presentations": self.ids[:1], "status": "REJECTED"})
+        other = create_conference(self.location, "Other")
+        elsewhere = Presentation.objects.create(
+            presenter_name="Elsewhere",
+            presenter_email="elsewhere@example.com",
+            title="Elsewhere",
+            synopsis="A talk",
+            status=self.status,
+            conference=other,
+        )
+
+        response = self.review(
+            {
+                # rejected, submitted, another conference's, missing
+                "presentations": [self.ids[0], self.ids[1], elsewhere.id, 0],
+                "status": "APPROVED",
+            }
+        )
+        self.assertEqual(response.json(), {"updated": 1, "skipped": 3})
+        self.assertEqual(self.get_status(self.ids[0]), "REJECTED")
+        self.assertEqual(self.get_status(elsewhere.id), "SUBMITTED")
+
+    def test_invalid_requests(self):
+        for body, message in (
+            ("[1]", "Expected a JSON object"),
+            ("{", "Expected a JSON object"),
+            (
+                {"presentations": "1", "status": "APPROVED"},
+                "Invalid presentation ids",
+            ),
+            (
+                {"presentations": ["1"], "status": "APPROVED"},
+                "Invalid presentation ids",
+            ),
+            (
+                {"presentations": self.ids, "status": "SUBMITTED"},
+                "Invalid status",
+            ),
+            ({"presentations": self.ids}, "Invalid status"),
+        ):
+            with self.subTest(body=body):
+                response = self.review(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["message"], message)
+        self.assertEqual(self.get_status(self.ids[0]), "SUBMITTED")
+
+
+class PresentationProjectionTests(ConferenceDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        presentation = self.conference.presentations.get()
+        self.url = f"/api/presentations/{presentation.id}/"
+
+    def get(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{self.url}?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.json(), queries
+
+    def test_fields_only_load_those_columns(self):
+        body, queries = self.get("fields=title")
+        self.assertEqual(body, {"href": self.url, "title": "Talk 0"})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("synopsis", queries[0]["sql"])
+
+    def test_expand_nests_in_one_query(self):
+        body, queries = self.get("expand=conference.location.state")
+        location = body["conference"]["location"]
+        self.assertEqual(location["name"], "Hall 0")
+        self.assertEqual(
+            location["state"], {"name": "Illinois", "abbreviation": "IL"}
+        )
+        self.assertEqual(len(queries), 1)